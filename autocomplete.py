@@ -0,0 +1,166 @@
+"""
+Autocomplete for the python command box.
+
+CompletionIndex keeps one prefix trie per kind of symbol the player types:
+inventory item names, the fields of an inventory entry, the fields of the
+customer data and the globals player code can use. suggest() looks at the
+text before the cursor to decide which trie applies, so a lookup costs
+O(length of the prefix + number of suggestions) no matter how big the
+catalog is, and items unlocked later are added one at a time.
+"""
+import re
+from collections import namedtuple
+
+from transaction_manager import PLAYER_GLOBAL_NAMES
+
+COMPLETION_LIMIT = 8  # Max suggestions shown at once
+INVENTORY_FIELDS = ("stock", "price", "restock_cost")
+CUSTOMER_FIELDS = ("id", "name", "type", "order", "patience")
+
+# What suggest() returns: the typed 'prefix' to replace, the 'candidates' to replace it with,
+# and 'closing' text to add after a candidate (e.g. "']" to finish a dictionary key).
+Completion = namedtuple("Completion", "prefix candidates closing")
+
+# Contexts, checked in order against the end of the current line (group 1 = quote, group 2 = typed prefix)
+_ITEM_KEY = re.compile(r"""(?:\binventory|\[\s*['"]order['"]\s*\])\s*\[\s*(['"])([^'"]*)$""")
+_CUSTOMER_KEY = re.compile(r"""\bcurrent_selected_customer_data\s*\[\s*(['"])([^'"]*)$""")
+_INVENTORY_FIELD_KEY = re.compile(r"""\]\s*\[\s*(['"])([^'"]*)$""")
+_IDENTIFIER = re.compile(r"""(?<![\w.'"])([A-Za-z_]\w*)$""")
+
+
+class _TrieNode:
+    __slots__ = ("children", "word", "count")
+
+    def __init__(self):
+        self.children = {}  # character -> _TrieNode
+        self.word = None  # The word ending here (original spelling), if any
+        self.count = 0  # Words in this subtree
+
+
+class PrefixTrie:
+    """
+    Set of words searchable by prefix. Matching ignores case, so 'Health' still finds
+    'health potion'; suggestions keep the word's own spelling.
+    """
+
+    def __init__(self, words=()):
+        self._root = _TrieNode()
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return self._root.count
+
+    def __contains__(self, word):
+        node = self._find(word.lower())
+        return node is not None and node.word == word
+
+    def __iter__(self):
+        return self._walk(self._root, None)
+
+    def _find(self, key):
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def add(self, word):
+        """Adds a word; returns False if it was already there."""
+        existing = self._find(word.lower())
+        if existing is not None and existing.word is not None:
+            if existing.word == word:
+                return False
+            existing.word = word  # Same word in different case: keep the newest spelling
+            return True
+        path = [self._root]
+        for char in word.lower():
+            path.append(path[-1].children.setdefault(char, _TrieNode()))
+        path[-1].word = word
+        for node in path:
+            node.count += 1
+        return True
+
+    def remove(self, word):
+        """Removes a word (and any branch left empty); returns False if it was not there."""
+        if word not in self:
+            return False
+        key = word.lower()
+        path = [self._root]
+        for char in key:
+            path.append(path[-1].children[char])
+        path[-1].word = None
+        for node in path:
+            node.count -= 1
+        for depth in range(len(key), 0, -1):
+            if path[depth].count:
+                break
+            del path[depth - 1].children[key[depth - 1]]
+        return True
+
+    def complete(self, prefix, limit=COMPLETION_LIMIT):
+        """Returns up to 'limit' words starting with 'prefix', in alphabetical order."""
+        node = self._find(prefix.lower())
+        if node is None:
+            return []
+        return list(self._walk(node, limit))
+
+    def _walk(self, node, limit):
+        """Yields the words under 'node' in order, stopping after 'limit' (None = all)."""
+        stack = [node]
+        found = 0
+        while stack:
+            node = stack.pop()
+            if node.word is not None:
+                yield node.word
+                found += 1
+                if found == limit:
+                    return
+            # Reversed so the alphabetically first child is popped first; empty branches are never kept
+            stack.extend(node.children[char] for char in sorted(node.children, reverse=True))
+
+
+class CompletionIndex:
+    """The symbols the python command box can complete, grouped by context."""
+
+    def __init__(self, item_names=()):
+        self.items = PrefixTrie(item_names)
+        self.inventory_fields = PrefixTrie(INVENTORY_FIELDS)
+        self.customer_fields = PrefixTrie(CUSTOMER_FIELDS)
+        self.globals = PrefixTrie(PLAYER_GLOBAL_NAMES)
+
+    def add_item(self, item_name):
+        self.items.add(item_name)
+
+    def sync_items(self, item_names):
+        """Makes the item trie match 'item_names' (e.g. after restoring an older game state)."""
+        item_names = set(item_names)
+        for item_name in [name for name in self.items if name not in item_names]:
+            self.items.remove(item_name)
+        for item_name in item_names:
+            self.items.add(item_name)
+
+    def suggest(self, line_before_cursor, limit=COMPLETION_LIMIT):
+        """
+        Returns a Completion for the text typed so far on the current line, or None if there
+        is nothing to suggest (unknown context, no match, or the word is already complete).
+        """
+        for pattern, trie in ((_ITEM_KEY, self.items), (_CUSTOMER_KEY, self.customer_fields),
+                              (_INVENTORY_FIELD_KEY, self.inventory_fields)):
+            match = pattern.search(line_before_cursor)
+            if match:
+                quote, prefix = match.groups()
+                return self._completion(trie, prefix, quote + "]", limit)
+
+        match = _IDENTIFIER.search(line_before_cursor)
+        if match:
+            return self._completion(self.globals, match.group(1), "", limit)
+        return None
+
+    @staticmethod
+    def _completion(trie, prefix, closing, limit):
+        candidates = trie.complete(prefix, limit)
+        if not candidates or candidates == [prefix]:
+            return None
+        return Completion(prefix, candidates, closing)
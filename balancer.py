@@ -0,0 +1,219 @@
+"""
+Monte Carlo economy balancer.
+
+Samples candidate economies (item prices and restock costs, level-up costs and
+customer order sizes), plays many simulated sessions for each with simulation.py
+and ranks them by how close they come to the target pacing. Candidates are
+searched with successive halving: every round all survivors are evaluated, only
+the best --keep-fraction of them go on to the next round (with proportionally
+more sessions each), and poor economies are dropped after a few cheap sessions,
+so most of the simulation budget goes to promising ones.
+
+All candidates of a round run on one process pool. Each candidate's catalog is a
+SharedCatalog and every task reports into its own row of one SharedCounters table.
+
+Usage:
+    python balancer.py --candidates 64 --workers 8
+    python balancer.py --candidates 200 --initial-sessions 50 --max-sessions 5000
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from game_state import ALL_GAME_ITEMS, LEVEL_UP_COSTS, ORDER_ITEM_COUNT_RANGE, ORDER_QUANTITY_RANGE
+from shared_state import SharedCatalog, SharedCounters, prepare_worker_processes
+from simulation import (REVENUE_BUCKETS, SESSION_LENGTH, STAT_FIELDS, TICKS_BUCKETS, histogram_percentile,
+                        simulate_chunk, split_evenly)
+
+# --- BALANCING TARGETS ---
+TARGET_TICKS_TO_LEVEL = {2: 25, 3: 80}  # Customers arrived (served or turned away) before reaching each level
+MAX_STOCKOUT_RATE = 0.05  # Share of customers that may be turned away for lack of stock
+STOCKOUT_WEIGHT = 10  # Score penalty per unit of stockout rate above MAX_STOCKOUT_RATE
+UNREACHED_LEVEL_PENALTY = 3  # Score penalty if no session reaches a level (scaled by the share that didn't)
+
+# --- SEARCH SPACE (inclusive ranges) ---
+PRICE_MULTIPLIER_RANGE = (0.6, 1.5)  # Applied to every item's current price
+RESTOCK_RATIO_RANGE = (0.45, 0.85)  # restock_cost as a share of the (new) price
+LEVEL_COST_MULTIPLIER_RANGE = (0.5, 6.0)  # Applied to each current LEVEL_UP_COSTS entry
+MAX_ITEMS_PER_ORDER_RANGE = (1, 4)
+MAX_QUANTITY_RANGE = (2, 8)
+
+
+def baseline_candidate():
+    """The economy the game currently ships with."""
+    return {
+        "price_multiplier": 1.0,
+        "restock_ratio": None,  # None keeps each item's current restock cost
+        "level_up_costs": dict(LEVEL_UP_COSTS),
+        "item_count_range": ORDER_ITEM_COUNT_RANGE,
+        "quantity_range": ORDER_QUANTITY_RANGE,
+    }
+
+
+def sample_candidate(rng):
+    """Draws one random economy from the search space."""
+    return {
+        "price_multiplier": round(rng.uniform(*PRICE_MULTIPLIER_RANGE), 3),
+        "restock_ratio": round(rng.uniform(*RESTOCK_RATIO_RANGE), 3),
+        "level_up_costs": {level: int(cost * rng.uniform(*LEVEL_COST_MULTIPLIER_RANGE))
+                           for level, cost in LEVEL_UP_COSTS.items()},
+        "item_count_range": (1, rng.randint(*MAX_ITEMS_PER_ORDER_RANGE)),
+        "quantity_range": (1, rng.randint(*MAX_QUANTITY_RANGE)),
+    }
+
+
+def candidate_items(candidate):
+    """Builds the item catalog ({name: {'price', 'restock_cost'}}) for a candidate."""
+    items = {}
+    for name, details in ALL_GAME_ITEMS.items():
+        price = max(1, round(details["price"] * candidate["price_multiplier"]))
+        if candidate["restock_ratio"] is None:
+            restock_cost = max(1, round(details["restock_cost"] * candidate["price_multiplier"]))
+        else:
+            restock_cost = max(1, round(price * candidate["restock_ratio"]))
+        items[name] = {"price": price, "restock_cost": restock_cost}
+    return items
+
+
+def summarize(totals):
+    """Extracts the balancing metrics from simulation totals."""
+    summary = {
+        "stockout_rate": totals["stockouts"] / max(totals["customers"], 1),
+        "revenue_percentiles": tuple(histogram_percentile(totals, "session_revenue", REVENUE_BUCKETS, fraction)
+                                     for fraction in (0.1, 0.5, 0.9)),
+        "levels": {},
+    }
+    for level in sorted(LEVEL_UP_COSTS):
+        reached = totals[f"reached_level_{level}"]
+        summary["levels"][level] = {
+            "reached_share": reached / max(totals["sessions"], 1),
+            "mean_ticks": totals[f"ticks_to_level_{level}"] / reached if reached else float("inf"),
+            "median_ticks": histogram_percentile(totals, f"level_{level}_ticks", TICKS_BUCKETS, 0.5),
+            "p90_ticks": histogram_percentile(totals, f"level_{level}_ticks", TICKS_BUCKETS, 0.9),
+        }
+    return summary
+
+
+def score(summary, session_length):
+    """Lower is better: log-distance from the target pacing plus stockout/unreached penalties."""
+    total = STOCKOUT_WEIGHT * max(0.0, summary["stockout_rate"] - MAX_STOCKOUT_RATE)
+    for level, target in TARGET_TICKS_TO_LEVEL.items():
+        stats = summary["levels"].get(level)
+        if stats is None:
+            continue
+        mean_ticks = stats["mean_ticks"] if stats["reached_share"] else 2 * session_length
+        total += abs(math.log(mean_ticks / target))
+        total += UNREACHED_LEVEL_PENALTY * (1 - stats["reached_share"])
+    return total
+
+
+def evaluate_round(pool, candidates, sessions, workers, session_length, seed):
+    """
+    Runs 'sessions' sessions for every candidate on the pool and returns their totals.
+    Every candidate uses the same seeds (common random numbers), so score differences
+    come from the economy rather than from luck.
+    """
+    chunks = max(1, math.ceil(workers / len(candidates)))  # Split candidates so every worker stays busy
+    catalogs = [SharedCatalog.create(candidate_items(candidate)) for candidate in candidates]
+    counters = SharedCounters.create(STAT_FIELDS, len(candidates) * chunks)
+    try:
+        tasks = []
+        for index, (candidate, catalog) in enumerate(zip(candidates, catalogs)):
+            for chunk, chunk_sessions in enumerate(split_evenly(sessions, chunks)):
+                tasks.append((catalog.name, counters.name, counters.rows, index * chunks + chunk, chunk_sessions,
+                              session_length, seed + chunk, candidate["level_up_costs"],
+                              candidate["item_count_range"], candidate["quantity_range"]))
+        pool.starmap(simulate_chunk, tasks, chunksize=1)
+        return [counters.totals(range(index * chunks, (index + 1) * chunks)) for index in range(len(candidates))]
+    finally:
+        counters.close()
+        for catalog in catalogs:
+            catalog.close()
+
+
+def search(candidates=64, workers=1, initial_sessions=40, max_sessions=2000, keep_fraction=0.5,
+           session_length=SESSION_LENGTH, seed=0, target_score=0.1, verbose=True):
+    """
+    Successive-halving search. Returns a list of (score, candidate, summary) for the final
+    survivors, best first. Stops early once only one candidate is left, the session budget
+    would exceed 'max_sessions', or the best score is already below 'target_score'.
+    """
+    rng = random.Random(seed)
+    pool_candidates = [baseline_candidate()] + [sample_candidate(rng) for _ in range(candidates - 1)]
+    sessions = initial_sessions
+    simulated_customers = 0
+    started = time.perf_counter()
+    round_number = 0
+
+    prepare_worker_processes()
+    with multiprocessing.Pool(workers) as pool:
+        while True:
+            round_number += 1
+            totals_list = evaluate_round(pool, pool_candidates, sessions, workers, session_length,
+                                         seed + 1000 * round_number)
+            ranked = []
+            for candidate, totals in zip(pool_candidates, totals_list):
+                summary = summarize(totals)
+                ranked.append((score(summary, session_length), candidate, summary))
+                simulated_customers += totals["customers"]
+            ranked.sort(key=lambda entry: entry[0])
+
+            if verbose:
+                elapsed = time.perf_counter() - started
+                print(f"Round {round_number}: {len(pool_candidates)} candidates x {sessions} sessions, "
+                      f"best score {ranked[0][0]:.3f} ({simulated_customers} customers simulated "
+                      f"in {elapsed:.1f}s, {simulated_customers / elapsed:.0f}/s)")
+
+            next_sessions = int(sessions / keep_fraction)
+            if len(ranked) == 1 or next_sessions > max_sessions or ranked[0][0] <= target_score:
+                return ranked[:3]
+            survivors = max(1, int(len(ranked) * keep_fraction))
+            pool_candidates = [candidate for _, candidate, _ in ranked[:survivors]]
+            sessions = next_sessions
+
+
+def format_candidate(rank, entry):
+    """Human-readable report of one ranked candidate."""
+    candidate_score, candidate, summary = entry
+    lines = [f"#{rank}  score {candidate_score:.3f}"]
+    restock = ("unchanged" if candidate["restock_ratio"] is None
+               else f"{candidate['restock_ratio']:.0%} of price")
+    lines.append(f"    prices x{candidate['price_multiplier']}, restock cost {restock}")
+    lines.append(f"    LEVEL_UP_COSTS = {candidate['level_up_costs']}")
+    lines.append(f"    ORDER_ITEM_COUNT_RANGE = {candidate['item_count_range']}, "
+                 f"ORDER_QUANTITY_RANGE = {candidate['quantity_range']}")
+    for level, stats in summary["levels"].items():
+        lines.append(f"    Level {level}: reached in {stats['reached_share']:.0%} of sessions, "
+                     f"mean {stats['mean_ticks']:.1f} customers (median <= {stats['median_ticks']}, "
+                     f"p90 <= {stats['p90_ticks']})")
+    p10, p50, p90 = summary["revenue_percentiles"]
+    lines.append(f"    Stockout rate {summary['stockout_rate']:.1%}, "
+                 f"revenue per session p10/p50/p90 <= ₱{p10} / ₱{p50} / ₱{p90}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for a balanced Script & Serve economy.")
+    parser.add_argument("--candidates", type=int, default=64, help="Economies sampled in the first round.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+    parser.add_argument("--initial-sessions", type=int, default=40, help="Sessions per candidate in round 1.")
+    parser.add_argument("--max-sessions", type=int, default=2000, help="Max sessions per candidate in a round.")
+    parser.add_argument("--keep-fraction", type=float, default=0.5, help="Share of candidates kept each round.")
+    parser.add_argument("--session-length", type=int, default=SESSION_LENGTH, help="Customers per session.")
+    parser.add_argument("--target-score", type=float, default=0.1, help="Stop as soon as a score is this low.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for sampling and simulation.")
+    args = parser.parse_args()
+
+    best = search(args.candidates, args.workers, args.initial_sessions, args.max_sessions, args.keep_fraction,
+                  args.session_length, args.seed, args.target_score)
+    print(f"\nTargets: customers arrived before reaching level {TARGET_TICKS_TO_LEVEL}, "
+          f"stockout rate <= {MAX_STOCKOUT_RATE:.0%}")
+    for rank, entry in enumerate(best, start=1):
+        print(format_candidate(rank, entry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Runs player code in a separate process that can be killed.
+
+The step budget in transaction_manager stops ordinary endless loops, but player code
+can catch the budget's RuntimeError (e.g. with a bare 'except:') and keep looping;
+CPython drops a trace function once it raises, so the loop then runs untraced and
+can never be interrupted from inside the process. CodeRunner sends each call to a
+worker process instead and kills that process if the call does not return in time,
+so neither the checker thread nor the Tk loop can be held forever by player code.
+"""
+
+
+class CodeTimeoutError(TimeoutError):
+    """Raised by CodeRunner.call when the worker process had to be killed."""
+
+
+class CodeRunner:
+    """
+    One worker process that runs module-level functions (e.g. transaction_manager.live_check)
+    with a time limit. The process is started on the first call and restarted after a timeout.
+    Not thread-safe: give each thread its own runner.
+    """
+
+    def __init__(self, name="player-code"):
+        self.name = name
+        self._process = None
+        self._connection = None
+
+    def _start(self):
+        # Imported here to keep multiprocessing off the game's startup path
+        import multiprocessing
+        # 'spawn' rather than 'fork': the game has a Tk loop and a checker thread running
+        context = multiprocessing.get_context("spawn")
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(target=_serve_calls, args=(child_connection,), name=self.name, daemon=True)
+        self._process.start()
+        child_connection.close()
+
+    def call(self, time_limit, function, *args, **kwargs):
+        """
+        Returns function(*args, **kwargs) computed in the worker process; exceptions raised by
+        the function are re-raised here. Raises CodeTimeoutError (and kills the worker) if it
+        takes longer than 'time_limit' seconds. Arguments and the result must be picklable.
+        """
+        if self._process is None or not self._process.is_alive():
+            self.stop()
+            self._start()
+        self._connection.send((function, args, kwargs))
+        if not self._connection.poll(time_limit):
+            self.stop()
+            raise CodeTimeoutError(f"Your code was still running after {time_limit:g} seconds and was stopped.")
+        try:
+            outcome, value = self._connection.recv()
+        except (EOFError, OSError):
+            # The worker died mid-call (e.g. the player code called os._exit())
+            self.stop()
+            raise RuntimeError("Your code stopped the process it was running in.") from None
+        if outcome == "error":
+            raise value
+        return value
+
+    def stop(self):
+        """Kills the worker process (a new one is started by the next call)."""
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._connection.close()
+        self._process = None
+        self._connection = None
+
+
+def _serve_calls(connection):
+    """Worker process loop: runs each (function, args, kwargs) it receives and sends back the outcome."""
+    while True:
+        try:
+            function, args, kwargs = connection.recv()
+        except EOFError:
+            return  # The game closed its end of the pipe
+        try:
+            connection.send(("ok", function(*args, **kwargs)))
+        except BaseException as e:  # Including SystemExit from sys.exit() in player code
+            # The result may not be picklable (player code can store anything in the inventory)
+            connection.send(("error", RuntimeError(f"{type(e).__name__}: {e}")))
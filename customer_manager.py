@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import random
+
+from game_state import ORDER_ITEM_COUNT_RANGE, ORDER_QUANTITY_RANGE
+
+# Customer types that jump ahead of everyone else in the queue
+VIP_CUSTOMER_TYPES = {"Noble"}
+
+# Priority values (lower is served first)
+VIP_PRIORITY = 0
+REGULAR_PRIORITY = 1
+
+
+def generate_order(available_items, rng=random, item_count_range=ORDER_ITEM_COUNT_RANGE,
+                   quantity_range=ORDER_QUANTITY_RANGE):
+    """
+    Builds a random order ({item name: quantity}) from the given item names.
+    'rng' can be a seeded random.Random so simulations are reproducible.
+    """
+    available_items = list(available_items)
+    if not available_items:
+        return {}
+
+    min_items, max_items = item_count_range
+    num_items_in_order = rng.randint(min(min_items, len(available_items)), min(len(available_items), max_items))
+    rng.shuffle(available_items)
+    min_quantity, max_quantity = quantity_range
+    return {item: rng.randint(min_quantity, max_quantity) for item in available_items[:num_items_in_order]}
+
+
+class CustomerQueue:
+    """
+    Queue of waiting customers.
+
+    Customers are stored in a dict keyed by 'id' (O(1) lookup, membership test
+    and removal) plus two heaps of ids:
+      - the service heap, ordered by (priority, patience deadline, arrival), used
+        to pick which customers are shown/served first (VIPs first, then whoever
+        will run out of patience soonest);
+      - the expiry heap, ordered by patience deadline, used to drop customers whose
+        patience has run out.
+    Removal by id only deletes the dict entry; stale heap entries are skipped when
+    they reach the top and the heaps are rebuilt once they are mostly stale.
+    """
+
+    def __init__(self, customers=()):
+        self._customers = {}  # id -> customer dict
+        self._service_heap = []  # (priority, deadline, arrival number, id)
+        self._expiry_heap = []  # (deadline, arrival number, id)
+        self._entries = {}  # id -> (priority, deadline, arrival number), to recognise stale heap entries
+        self._arrivals = itertools.count()
+        self.current_tick = 0  # Game 'ticks' elapsed; a customer's deadline is arrival tick + patience
+        for customer in customers:
+            self.append(customer)
+
+    def __len__(self):
+        return len(self._customers)
+
+    def __contains__(self, customer_id):
+        return customer_id in self._customers
+
+    def __iter__(self):
+        """Iterates over customers in arrival order."""
+        return iter(list(self._customers.values()))
+
+    def deadline(self, customer_id):
+        """Tick at which this waiting customer runs out of patience."""
+        return self._entries[customer_id][1]
+
+    def append(self, customer, deadline=None):
+        """
+        Adds a customer (a dict with at least 'id', 'type' and optionally 'patience').
+        'deadline' overrides current tick + patience (used when restoring a saved queue).
+        """
+        customer_id = customer['id']
+        if customer_id in self._customers:
+            raise ValueError(f"Customer id {customer_id} is already in the queue.")
+        priority = VIP_PRIORITY if customer.get('type') in VIP_CUSTOMER_TYPES else REGULAR_PRIORITY
+        if deadline is None:
+            deadline = self.current_tick + customer.get('patience', float('inf'))
+        arrival = next(self._arrivals)
+
+        self._customers[customer_id] = customer
+        self._entries[customer_id] = (priority, deadline, arrival)
+        heapq.heappush(self._service_heap, (priority, deadline, arrival, customer_id))
+        heapq.heappush(self._expiry_heap, (deadline, arrival, customer_id))
+
+    def remove(self, customer_id):
+        """Removes and returns the customer with this id (None if they are not waiting)."""
+        customer = self._customers.pop(customer_id, None)
+        if customer is not None:
+            del self._entries[customer_id]
+            self._compact_if_needed()
+        return customer
+
+    def _is_live(self, customer_id, priority, deadline, arrival):
+        return self._entries.get(customer_id) == (priority, deadline, arrival)
+
+    def _compact_if_needed(self):
+        """Rebuilds the heaps when more than half of their entries are stale."""
+        if len(self._service_heap) > 2 * len(self._customers) + 16:
+            self._service_heap = [entry for entry in self._service_heap if self._is_live(entry[3], *entry[:3])]
+            heapq.heapify(self._service_heap)
+        if len(self._expiry_heap) > 2 * len(self._customers) + 16:
+            self._expiry_heap = [entry for entry in self._expiry_heap
+                                 if self._entries.get(entry[2], (None,))[1:] == entry[:2]]
+            heapq.heapify(self._expiry_heap)
+
+    def peek(self):
+        """Returns the customer who should be served next (None if the queue is empty)."""
+        while self._service_heap:
+            priority, deadline, arrival, customer_id = self._service_heap[0]
+            if self._is_live(customer_id, priority, deadline, arrival):
+                return self._customers[customer_id]
+            heapq.heappop(self._service_heap)
+        return None
+
+    def first(self, count):
+        """Returns up to 'count' customers in service order without removing them (O(count log n))."""
+        if count <= 0:
+            return []
+        self.peek()  # Drops stale entries from the top so the walk below starts on a live one
+        result = []
+        candidates = [(self._service_heap[0], 0)] if self._service_heap else []
+        while candidates and len(result) < count:
+            entry, index = heapq.heappop(candidates)
+            if self._is_live(entry[3], *entry[:3]):
+                result.append(self._customers[entry[3]])
+            # Children of a heap node are never smaller than it, so walking the heap as a tree stays in order
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self._service_heap):
+                    heapq.heappush(candidates, (self._service_heap[child], child))
+        return result
+
+    def advance(self, ticks=1):
+        """
+        Moves the game clock forward and removes customers whose patience ran out.
+        Returns the list of customers who left.
+        """
+        self.current_tick += ticks
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= self.current_tick:
+            deadline, arrival, customer_id = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(customer_id)
+            if entry is None or entry[1:] != (deadline, arrival):
+                continue  # Stale entry for a customer who was already removed
+            expired.append(self.remove(customer_id))
+        return expired
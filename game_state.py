@@ -0,0 +1,417 @@
+import bisect
+import time
+from collections import namedtuple
+from collections.abc import Mapping
+
+# --- GAME RULES / CATALOG (shared by the GUI and the simulation workers) ---
+STARTING_BALANCE = 1000
+
+# Master list of all possible items in the game
+ALL_GAME_ITEMS = {
+    "health potion": {"price": 50, "restock_cost": 30},
+    "mana elixir": {"price": 75, "restock_cost": 45},
+    "iron sword": {"price": 200, "restock_cost": 120},
+    "leather armor": {"price": 150, "restock_cost": 90},
+    "healing salve": {"price": 20, "restock_cost": 12},
+    "scroll of fireball": {"price": 120, "restock_cost": 80},
+    "gold coin pouch": {"price": 10, "restock_cost": 5},  # Small item for common orders
+    "enchanted amulet": {"price": 500, "restock_cost": 350},
+}
+
+# Items unlocked at each level (and their initial stock level for fresh unlock)
+LEVEL_ITEM_UNLOCKS = {
+    1: {"health potion": {"stock": 10}, "mana elixir": {"stock": 5}},  # Initial items
+    2: {"iron sword": {"stock": 0}, "leather armor": {"stock": 0}, "healing salve": {"stock": 15}},
+    3: {"scroll of fireball": {"stock": 0}, "gold coin pouch": {"stock": 20}, "enchanted amulet": {"stock": 0}},
+}
+
+# Level-up costs/thresholds (for future use)
+LEVEL_UP_COSTS = {
+    2: 500,
+    3: 1500,
+}
+
+# Customer order sizes (inclusive ranges)
+ORDER_ITEM_COUNT_RANGE = (1, 3)  # Distinct items per order
+ORDER_QUANTITY_RANGE = (1, 5)  # Units of each ordered item
+PATIENCE_RANGE = (3, 6)  # Ticks a customer waits before leaving
+HISTORY_LIMIT = 1000  # Game state versions kept for undo/redo (the oldest are dropped first)
+
+
+# --- VERSIONED GAME STATE (undo/redo) ---
+# PersistentMap is a hash array mapped trie: a tree of nodes with up to 32 children, each level
+# indexed by the next 5 bits of the key's hash. set()/delete() copy only the nodes on the path
+# to the changed key (about log32(n) small tuples) and share everything else with the old map,
+# so keeping every version of the game state costs memory per change, not per item.
+_HASH_BITS = 5
+_HASH_MASK = (1 << _HASH_BITS) - 1
+_MISSING = object()
+
+
+class _Leaf:
+    __slots__ = ("hash", "key", "value")
+
+    def __init__(self, key_hash, key, value):
+        self.hash = key_hash
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    """Keys whose full hashes are equal, stored as a tuple of (key, value) pairs."""
+    __slots__ = ("hash", "items")
+
+    def __init__(self, key_hash, items):
+        self.hash = key_hash
+        self.items = items
+
+
+class _Node:
+    """Branch node: 'bitmap' has one bit set per occupied slot; 'children' holds only the occupied slots."""
+    __slots__ = ("bitmap", "children")
+
+    def __init__(self, bitmap, children):
+        self.bitmap = bitmap
+        self.children = children
+
+
+_EMPTY_NODE = _Node(0, ())
+
+
+def _hash(key):
+    return hash(key) & 0xFFFFFFFFFFFFFFFF  # Non-negative, so shifting always runs out of bits
+
+
+def _slot(key_hash, shift, bitmap):
+    """Returns (bit, index into children) of key_hash's slot in a node at depth 'shift'."""
+    bit = 1 << ((key_hash >> shift) & _HASH_MASK)
+    return bit, bin(bitmap & (bit - 1)).count("1")
+
+
+def _merge(shift, first, second):
+    """Builds the smallest subtree holding two leaves/collisions with different hashes."""
+    first_bit = 1 << ((first.hash >> shift) & _HASH_MASK)
+    second_bit = 1 << ((second.hash >> shift) & _HASH_MASK)
+    if first_bit == second_bit:
+        return _Node(first_bit, (_merge(shift + _HASH_BITS, first, second),))
+    children = (first, second) if first_bit < second_bit else (second, first)
+    return _Node(first_bit | second_bit, children)
+
+
+def _assoc(node, shift, key_hash, key, value):
+    """Returns (node with key set to value, whether the key is new). Returns 'node' itself if nothing changed."""
+    if isinstance(node, _Node):
+        bit, index = _slot(key_hash, shift, node.bitmap)
+        if not node.bitmap & bit:
+            children = node.children[:index] + (_Leaf(key_hash, key, value),) + node.children[index:]
+            return _Node(node.bitmap | bit, children), True
+        child = node.children[index]
+        new_child, added = _assoc(child, shift + _HASH_BITS, key_hash, key, value)
+        if new_child is child:
+            return node, False
+        return _Node(node.bitmap, node.children[:index] + (new_child,) + node.children[index + 1:]), added
+
+    if isinstance(node, _Leaf):
+        if node.hash != key_hash:
+            return _merge(shift, node, _Leaf(key_hash, key, value)), True
+        if node.key == key:
+            return (node, False) if node.value is value else (_Leaf(key_hash, key, value), False)
+        return _Collision(key_hash, ((node.key, node.value), (key, value))), True
+
+    # _Collision
+    if node.hash != key_hash:
+        return _merge(shift, node, _Leaf(key_hash, key, value)), True
+    for i, (existing_key, existing_value) in enumerate(node.items):
+        if existing_key == key:
+            if existing_value is value:
+                return node, False
+            return _Collision(key_hash, node.items[:i] + ((key, value),) + node.items[i + 1:]), False
+    return _Collision(key_hash, node.items + ((key, value),)), True
+
+
+def _dissoc(node, shift, key_hash, key):
+    """Returns the node without 'key' (None if nothing is left), or 'node' itself if the key is absent."""
+    if isinstance(node, _Node):
+        bit, index = _slot(key_hash, shift, node.bitmap)
+        if not node.bitmap & bit:
+            return node
+        child = node.children[index]
+        new_child = _dissoc(child, shift + _HASH_BITS, key_hash, key)
+        if new_child is child:
+            return node
+        if new_child is None:
+            bitmap = node.bitmap & ~bit
+            children = node.children[:index] + node.children[index + 1:]
+            if shift and len(children) == 1 and not isinstance(children[0], _Node):
+                return children[0]  # A branch holding one leaf is replaced by the leaf
+            return _Node(bitmap, children) if bitmap else None
+        if shift and len(node.children) == 1 and not isinstance(new_child, _Node):
+            return new_child
+        return _Node(node.bitmap, node.children[:index] + (new_child,) + node.children[index + 1:])
+
+    if isinstance(node, _Leaf):
+        return None if node.hash == key_hash and node.key == key else node
+
+    # _Collision
+    if node.hash != key_hash:
+        return node
+    items = tuple(item for item in node.items if item[0] != key)
+    if len(items) == len(node.items):
+        return node
+    return _Leaf(key_hash, *items[0]) if len(items) == 1 else _Collision(key_hash, items)
+
+
+def _iter_items(node):
+    if isinstance(node, _Node):
+        for child in node.children:
+            yield from _iter_items(child)
+    elif isinstance(node, _Leaf):
+        yield node.key, node.value
+    else:
+        yield from node.items
+
+
+class PersistentMap(Mapping):
+    """
+    Immutable mapping with structural sharing. set(), delete() and update() return a new
+    map and leave this one untouched; the two share every node that did not change.
+    """
+
+    __slots__ = ("_root", "_length")
+
+    def __init__(self, items=None):
+        self._root = _EMPTY_NODE
+        self._length = 0
+        if items:
+            updated = self.update(items)
+            self._root, self._length = updated._root, updated._length
+
+    @classmethod
+    def _from_root(cls, root, length):
+        new_map = cls.__new__(cls)
+        new_map._root = root if root is not None else _EMPTY_NODE
+        new_map._length = length
+        return new_map
+
+    def __getitem__(self, key):
+        key_hash = _hash(key)
+        node = self._root
+        shift = 0
+        while isinstance(node, _Node):
+            bit, index = _slot(key_hash, shift, node.bitmap)
+            if not node.bitmap & bit:
+                raise KeyError(key)
+            node = node.children[index]
+            shift += _HASH_BITS
+        if isinstance(node, _Leaf):
+            if node.hash == key_hash and node.key == key:
+                return node.value
+        elif node.hash == key_hash:
+            for existing_key, value in node.items:
+                if existing_key == key:
+                    return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        return (key for key, _ in _iter_items(self._root))
+
+    def __len__(self):
+        return self._length
+
+    def items(self):
+        return _iter_items(self._root)  # Faster than Mapping's default, which looks every key up again
+
+    def set(self, key, value):
+        """Returns a new map with key set to value."""
+        root, added = _assoc(self._root, 0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return PersistentMap._from_root(root, self._length + added)
+
+    def delete(self, key):
+        """Returns a new map without 'key' (raises KeyError if it is missing)."""
+        root = _dissoc(self._root, 0, _hash(key), key)
+        if root is self._root:
+            raise KeyError(key)
+        return PersistentMap._from_root(root, self._length - 1)
+
+    def update(self, items):
+        """Returns a new map with every (key, value) of 'items' (a mapping or pairs) set."""
+        root, length = self._root, self._length
+        for key, value in (items.items() if isinstance(items, Mapping) else items):
+            root, added = _assoc(root, 0, _hash(key), key, value)
+            length += added
+        return PersistentMap._from_root(root, length)
+
+    def __repr__(self):
+        return f"PersistentMap({dict(self.items())!r})"
+
+
+class PersistentLog:
+    """
+    Immutable append-only list. append()/extend() return a new log whose nodes link back
+    to this one, so every version of a growing list (e.g. the sales made so far) shares
+    all earlier entries.
+    """
+
+    __slots__ = ("_last", "_length")
+
+    def __init__(self, items=()):
+        self._last = None  # (newest entry, node before it) or None when empty
+        self._length = 0
+        for item in items:
+            self._last = (item, self._last)
+            self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """Iterates oldest entry first."""
+        entries = []
+        node = self._last
+        while node is not None:
+            entries.append(node[0])
+            node = node[1]
+        return reversed(entries)
+
+    def extend(self, items):
+        """Returns a new log with 'items' appended."""
+        new_log = PersistentLog()
+        new_log._last, new_log._length = self._last, self._length
+        for item in items:
+            new_log._last = (item, new_log._last)
+            new_log._length += 1
+        return new_log
+
+    def append(self, item):
+        return self.extend((item,))
+
+
+# One saved point of a session. 'inventory' maps item name -> {'stock', 'price', 'restock_cost'},
+# 'customers' maps customer id -> (customer dict, patience deadline tick). Both are PersistentMaps.
+# 'sales' is a PersistentLog of the sales completed so far.
+GameVersion = namedtuple("GameVersion", "number label timestamp inventory balance customers tick sales")
+
+
+def copy_customer(customer):
+    """Copy of a customer dict that shares nothing mutable with it (player code may edit the live one)."""
+    return dict(customer, order=dict(customer['order']))
+
+
+def _copy_customer_entry(entry):
+    customer, deadline = entry
+    return copy_customer(customer), deadline
+
+
+def _changed_map(snapshot, current, copy_value=lambda value: value, keys=None):
+    """
+    Returns 'snapshot' updated to match the 'current' dict, storing copies of changed values only.
+    If 'keys' is given, only those keys are compared (the caller knows nothing else changed).
+    """
+    if keys is None:
+        keys = [key for key in snapshot if key not in current] + list(current)
+    for key in keys:
+        value = current.get(key, _MISSING)
+        if value is _MISSING:
+            if key in snapshot:
+                snapshot = snapshot.delete(key)
+        elif snapshot.get(key, _MISSING) != value:
+            snapshot = snapshot.set(key, copy_value(value))
+    return snapshot
+
+
+class GameHistory:
+    """
+    Linear history of game state versions with undo/redo and restore-to-time.
+
+    Each commit() stores a GameVersion whose maps share every unchanged entry with the
+    previous version, so memory grows with the number of changes rather than with
+    catalog size x number of versions. Committing after an undo discards the redo branch.
+    """
+
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.limit = limit
+        self._versions = []
+        self._timestamps = []  # Parallel to _versions, for bisecting in restore_to_time()
+        self._position = -1  # Index of the current version
+        self._next_number = 1
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __iter__(self):
+        return iter(list(self._versions))
+
+    @property
+    def current(self):
+        return self._versions[self._position] if self._versions else None
+
+    @property
+    def can_undo(self):
+        return self._position > 0
+
+    @property
+    def can_redo(self):
+        return self._position < len(self._versions) - 1
+
+    def commit(self, label, inventory, balance, customers, tick=0, timestamp=None, changed_items=None, sales=()):
+        """
+        Records a new version and makes it current.
+        'inventory' is the live inventory dict; 'customers' maps customer id -> (customer, deadline).
+        Both are copied, so later edits to the live dicts never reach a saved version.
+        'changed_items' optionally lists the only inventory items that may have changed since the
+        previous version, so large inventories are not compared in full. 'sales' is the live list of
+        completed sales; only entries beyond the previous version's are stored (the earlier ones are
+        expected to be unchanged). Returns the new GameVersion.
+        """
+        previous = self.current
+        if previous is None:
+            changed_items = None
+        inventory_map = _changed_map(previous.inventory if previous else PersistentMap(), inventory, dict,
+                                     changed_items)
+        customers_map = _changed_map(previous.customers if previous else PersistentMap(), customers,
+                                     _copy_customer_entry)
+        previous_sales = previous.sales if previous else PersistentLog()
+        if len(sales) >= len(previous_sales):
+            sales_log = previous_sales.extend(sales[len(previous_sales):])
+        else:
+            sales_log = PersistentLog(sales)
+        version = GameVersion(self._next_number, label, time.time() if timestamp is None else timestamp,
+                              inventory_map, balance, customers_map, tick, sales_log)
+        self._next_number += 1
+
+        del self._versions[self._position + 1:]  # A new change ends the redo branch
+        del self._timestamps[self._position + 1:]
+        self._versions.append(version)
+        self._timestamps.append(version.timestamp)
+        if len(self._versions) > self.limit:
+            del self._versions[0]
+            del self._timestamps[0]
+        self._position = len(self._versions) - 1
+        return version
+
+    def undo(self):
+        """Steps back one version and returns it (None if there is nothing to undo)."""
+        if not self.can_undo:
+            return None
+        self._position -= 1
+        return self.current
+
+    def redo(self):
+        """Steps forward one version and returns it (None if there is nothing to redo)."""
+        if not self.can_redo:
+            return None
+        self._position += 1
+        return self.current
+
+    def restore_to_time(self, timestamp):
+        """
+        Makes the last version committed at or before 'timestamp' current and returns it
+        (None if every version is newer). Later versions stay available to redo().
+        """
+        index = bisect.bisect_right(self._timestamps, timestamp) - 1
+        if index < 0:
+            return None
+        self._position = index
+        return self.current
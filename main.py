@@ -1,8 +1,27 @@
+import sys
+# Structured event log (JSON lines), Prometheus metrics and the startup profiler.
+# Imported first so that --profile-startup can time every import below it.
+from utils import event_log, metrics, startup_profiler
+
+if "--profile-startup" in sys.argv:
+    startup_profiler.enable()
+
+import argparse
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
 import tkinter.messagebox  # Import for pop-up messages
 import random  # For customer generation and shuffling lists
+import time  # For measuring grading latency
+import queue  # Hands live-check jobs/results between the Tk loop and the checker thread
+import threading
+from autocomplete import CompletionIndex  # Prefix tries behind the python command box suggestions
+from customer_manager import CustomerQueue, generate_order  # Customer queue and random order generation
+from portraits import PortraitAtlas, import_pil  # Portraits from one sprite atlas; lazy Pillow import for all images
+from game_state import ALL_GAME_ITEMS, LEVEL_ITEM_UNLOCKS, PATIENCE_RANGE, STARTING_BALANCE, GameHistory, copy_customer
+from code_runner import CodeRunner, CodeTimeoutError  # Worker process that is killed if player code never stops
+from transaction_manager import (BULK_TIME_LIMIT_SECONDS, BULK_TIME_LIMIT_SECONDS_PER_ORDER,
+                                 LIVE_CHECK_TIME_LIMIT_SECONDS, BulkResult, SubmissionResult, grade_bulk_submission,
+                                 grade_submission, live_check)  # Runs/verifies player code
 
 # --- GLOBAL UI Element References (for state management) ---
 # These variables need to be accessible and modifiable by different functions
@@ -11,40 +30,43 @@ python_command_textbox = None
 current_selected_customer_data = None  # Stores data of customer currently being handled (the one whose 'Serve' button was last clicked)
 all_serve_buttons = []  # List to hold references to all 'Serve' buttons on customer cards
 btn_complete_sale_ref = None  # Reference to the 'Complete Sale' button
+btn_run_code_ref = None  # Reference to the 'Run Code' button (disabled while a verified sale waits for 'Complete Sale')
 customer_cards_container = None  # Reference to the frame holding customer cards, needed for repopulation
+customer_portrait_labels = []  # (label, customer type) of the cards on screen, to add portraits once they load
+portrait_atlas = PortraitAtlas()  # One shared PhotoImage per customer type, loaded after the window is shown
+live_check_enabled = None  # tk.BooleanVar behind the 'Live check' checkbox
+live_check_status_label = None  # Inline result of the latest live check (under the python command box)
+btn_undo_ref = None  # Sidebar 'Undo' button (enabled while there is an earlier version to go back to)
+btn_redo_ref = None  # Sidebar 'Redo' button
+completion_listbox = None  # Suggestion list shown under the cursor in the python command box
+
+# --- AUTOCOMPLETE STATE ---
+completion_index = CompletionIndex()  # Item names (added as they unlock), field names and player globals
+_completion = None  # Completion currently shown in completion_listbox (None when hidden)
+_completion_chosen = False  # True once Up/Down picked a suggestion (only then does Return insert it)
+# Keys whose release should not recompute suggestions (they navigate/accept them, or are modifiers)
+COMPLETION_IGNORED_KEYS = {"Up", "Down", "Return", "Tab", "Escape", "Shift_L", "Shift_R", "Control_L",
+                           "Control_R", "Alt_L", "Alt_R"}
+
+# --- LIVE CHECK STATE ---
+LIVE_CHECK_DEBOUNCE_MS = 400  # Wait this long after the last keystroke before checking
+LIVE_CHECK_POLL_MS = 100  # How often the Tk loop picks up results from the checker thread
+_live_check_after_id = None  # Pending debounce timer
+_live_check_sequence = 0  # Number of the most recently requested check (older results are ignored)
+_live_check_jobs = queue.Queue()
+_live_check_results = queue.Queue()
+serve_all_runner = CodeRunner("serve-all")  # Worker process for Serve All (started on first use)
 
 # --- GLOBAL GAME STATE VARIABLES (Consolidated) ---
 player_level = 1
-balance = 1000  # Starting balance
+balance = STARTING_BALANCE  # Starting balance
 game_time = 900  # 9:00 AM (HHMM format)
 inventory = {}  # Will be populated at startup by unlock_level_items
 MAX_CUSTOMERS = 4  # Max simultaneous customers displayable on UI
-active_customers = []  # List to hold currently active customer dictionaries (actual game state)
-
-# Master list of all possible items in the game
-ALL_GAME_ITEMS = {
-    "health potion": {"price": 50, "restock_cost": 30},
-    "mana elixir": {"price": 75, "restock_cost": 45},
-    "iron sword": {"price": 200, "restock_cost": 120},
-    "leather armor": {"price": 150, "restock_cost": 90},
-    "healing salve": {"price": 20, "restock_cost": 12},
-    "scroll of fireball": {"price": 120, "restock_cost": 80},
-    "gold coin pouch": {"price": 10, "restock_cost": 5},  # Small item for common orders
-    "enchanted amulet": {"price": 500, "restock_cost": 350},
-}
-
-# Items unlocked at each level (and their initial stock level for fresh unlock)
-LEVEL_ITEM_UNLOCKS = {
-    1: {"health potion": {"stock": 10}, "mana elixir": {"stock": 5}},  # Initial items
-    2: {"iron sword": {"stock": 0}, "leather armor": {"stock": 0}, "healing salve": {"stock": 15}},
-    3: {"scroll of fireball": {"stock": 0}, "gold coin pouch": {"stock": 20}, "enchanted amulet": {"stock": 0}},
-}
-
-# Level-up costs/thresholds (for future use)
-LEVEL_UP_COSTS = {
-    2: 500,
-    3: 1500,
-}
+active_customers = CustomerQueue()  # Currently active customer dictionaries, indexed by 'id' (actual game state)
+sales_history = []  # Completed sales ({'name', 'order', 'total'}), shown in the Sales panel
+history = GameHistory()  # Saved versions of inventory/balance/customers for undo, redo and restore-to-time
+sale_changed_items = set()  # Inventory items changed by the sale Run Code applied (saved by 'Complete Sale')
 
 # List of names for customer generation
 FIRST_NAMES = ["Sir Reginald", "Lady Elara", "Master Theron", "Apprentice Lyra", "Goblin Gnarl", "Orc Grunt",
@@ -82,7 +104,6 @@ def format_time(time_int):
 def unlock_level_items(level, current_inventory):
     """Adds new items to the inventory based on the player's level."""
     if level in LEVEL_ITEM_UNLOCKS:
-        print(f"\n--- NEW ITEMS UNLOCKED FOR LEVEL {level}! ---")
         for item_name, initial_details in LEVEL_ITEM_UNLOCKS[level].items():
             if item_name not in current_inventory:  # Only add if not already present
                 current_inventory[item_name] = {
@@ -90,9 +111,8 @@ def unlock_level_items(level, current_inventory):
                     "price": ALL_GAME_ITEMS[item_name]["price"],
                     "restock_cost": ALL_GAME_ITEMS[item_name]["restock_cost"]
                 }
-                print(
-                    f"- {item_name.title()} (Price: ₱{current_inventory[item_name]['price']}, Restock: ₱{current_inventory[item_name]['restock_cost']})")
-        print("-------------------------------------------\n")
+                event_log.log("item_unlocked", level=level, item=item_name, **current_inventory[item_name])
+                completion_index.add_item(item_name)
 
 
 def generate_customer():
@@ -102,26 +122,25 @@ def generate_customer():
     available_items_for_order = list(inventory.keys())  # Use the global 'inventory'
 
     if not available_items_for_order:
-        print("Warning: No items in inventory to generate customer orders from (is inventory empty?).")
+        event_log.log("customer_generation_failed", reason="empty inventory")
         return None
 
-    num_items_in_order = random.randint(1, min(len(available_items_for_order), 3))  # 1 to 3 distinct items
-    order = {}
-
-    random.shuffle(available_items_for_order)
+    order = generate_order(available_items_for_order)  # 1 to 3 distinct items, 1 to 5 units each
 
-    for i in range(num_items_in_order):
-        item = available_items_for_order[i]
-        quantity = random.randint(1, 5)  # Order 1 to 5 units of an item
-        order[item] = quantity
+    customer_id = random.randint(1000, 9999)
+    while customer_id in active_customers:  # Make sure the ID is unique among waiting customers
+        customer_id = random.randint(1000, 9999)
 
     customer = {
-        "id": random.randint(1000, 9999),  # Unique ID for identification
+        "id": customer_id,  # Unique ID for identification
         "name": name,
         "type": random.choice(["Knight", "Mage", "Raider", "Noble", "Merchant"]),  # Expanded types
         "order": order,
-        "patience": random.randint(3, 6)  # How many "ticks" before they leave (for future time system)
+        "patience": random.randint(*PATIENCE_RANGE)  # How many "ticks" (completed sales) they wait before leaving
     }
+    metrics.inc("customers_generated_total")
+    event_log.log("customer_generated", customer_id=customer["id"], name=name, customer_type=customer["type"],
+                  order=order, patience=customer["patience"])
     return customer
 
 
@@ -153,8 +172,9 @@ def serve_customer_ui_action(customer_data):
         # Clear the python command box for new input, if a customer is selected
         if python_command_textbox:
             python_command_textbox.delete('1.0', tk.END)
+            schedule_live_check()
 
-        print(f"Customer {customer_data['name']}'s order loaded for handling.")
+        event_log.log("order_loaded", customer_id=customer_data['id'], name=customer_data['name'])
     else:
         print("Error: Customer order display textbox not initialized.")
 
@@ -168,8 +188,7 @@ def serve_customer_and_update_buttons(customer_data, clicked_button):
     global all_serve_buttons, btn_complete_sale_ref
 
     # First, disable the 'Complete Sale' button, as a new customer/transaction means previous code is invalid
-    if btn_complete_sale_ref:
-        btn_complete_sale_ref.config(state='disabled')
+    set_sale_verified(False)
 
     # Update the states and text of all 'Serve' buttons
     for btn in all_serve_buttons:
@@ -187,10 +206,10 @@ def serve_customer_and_update_buttons(customer_data, clicked_button):
 def run_code_command():
     """
     Called when the 'Run Code' button is pressed.
-    Retrieves the Python code from the textbox, attempts to validate it (simulated for now),
+    Retrieves the Python code from the textbox, runs and verifies it with grade_submission,
     and provides feedback.
     """
-    global inventory, balance  # <<< RE-ADD THIS LINE HERE
+    global inventory, balance, sale_changed_items  # <<< RE-ADD THIS LINE HERE
     global python_command_textbox, btn_complete_sale_ref, current_selected_customer_data
 
     if not current_selected_customer_data:
@@ -201,155 +220,264 @@ def run_code_command():
 
     if not player_code:
         tkinter.messagebox.showwarning("Empty Code", "Please enter some Python code to run.")
-        if btn_complete_sale_ref:
-            btn_complete_sale_ref.config(state='disabled')
+        set_sale_verified(False)
         return
 
-    # --- Prepare the execution environment (sandbox) ---
-    # Create copies of inventory and balance for the player's code to modify.
-    # This allows us to verify changes without directly affecting the real game state yet.
-    exec_inventory = {item: data.copy() for item, data in inventory.items()}
-    exec_balance = balance
-
-    # A mutable list to hold balance so inner code can modify it and it's reflected outside
-    # (because integers are immutable, `balance += X` creates a new int, not modifies the original if global)
-    balance_wrapper = [exec_balance]
-
-    # Define the scope for the player's code execution
-    execution_globals = {
-        'inventory': exec_inventory,  # Player can access/modify this
-        'balance': balance_wrapper,  # Player can access/modify this (via [0])
-        'current_selected_customer_data': current_selected_customer_data,  # Player can access customer data
-        'print': print,  # Allow player to use print() for debugging
-        # You can add other helper functions here for higher levels
-    }
-    execution_locals = {}  # No specific local variables needed
+    grading_started = time.perf_counter()
+    metrics.inc("submissions_total")
+
+    # Execute and verify the player's code against copies of the game state
+    result = grade_submission(player_code, inventory, balance, current_selected_customer_data)
+
+    if result.verdict == "correct":
+        revenue = result.updated_balance - balance
+        metrics.inc("revenue_total", revenue)
+        _record_grading(result.verdict, grading_started, player_code, revenue=revenue)
+        tkinter.messagebox.showinfo(result.title, result.message)
+        # Apply changes to actual global game state immediately upon successful verification
+        sale_changed_items = changed_inventory_items(result.updated_inventory)
+        inventory.update(result.updated_inventory)
+        balance = result.updated_balance
+        _discard_live_check("✓ Code verified. Click 'Complete Sale' to finalize.", "green")
+        set_sale_verified(True)  # Enable Complete Sale; Run Code must not apply the same sale twice
+    else:
+        _record_grading(result.verdict, grading_started, player_code, error=result.message)
+        tkinter.messagebox.showerror(result.title, result.message)
+        set_sale_verified(False)
+
+
+def changed_inventory_items(updated_inventory):
+    """
+    Names of the items whose details differ between 'updated_inventory' and the live inventory.
+    verify_transaction only checks stock, so the player's code may also have edited prices.
+    """
+    return {item for item, details in updated_inventory.items() if inventory.get(item) != details}
+
+
+def set_sale_verified(verified):
+    """
+    Switches between a sale applied by Run Code (only 'Complete Sale' is enabled) and no
+    sale in progress (only 'Run Code' is enabled).
+    """
+    if btn_complete_sale_ref:
+        btn_complete_sale_ref.config(state='normal' if verified else 'disabled')
+    if btn_run_code_ref:
+        btn_run_code_ref.config(state='disabled' if verified else 'normal')
+
 
-    transaction_verified_correctly = False
-    print(
-        f"\n--- Executing player code for {current_selected_customer_data['name']} (Order ID: {current_selected_customer_data['id']}) ---")
-    print(f"Player Code:\n{player_code}\n---")
+def sale_in_progress():
+    """True while Run Code has applied a sale to inventory/balance that 'Complete Sale' has not finished yet."""
+    return bool(btn_complete_sale_ref) and str(btn_complete_sale_ref['state']) == 'normal'
 
+
+def schedule_live_check(event=None):
+    """
+    Bound to key presses in the python command box. Restarts the debounce timer so the
+    live check only runs once the player pauses typing.
+    """
+    global _live_check_after_id
+
+    if python_command_textbox is None:
+        return
+    if _live_check_after_id is not None:
+        python_command_textbox.after_cancel(_live_check_after_id)
+    _live_check_after_id = python_command_textbox.after(LIVE_CHECK_DEBOUNCE_MS, start_live_check)
+
+
+def start_live_check():
+    """Sends the current code and a snapshot of the game state to the checker thread."""
+    global _live_check_after_id, _live_check_sequence
+
+    _live_check_after_id = None
+    if sale_in_progress():
+        # The sale is already applied, so the same code would be checked against the updated stock;
+        # keep showing the "Code verified" status instead
+        return
+    player_code = python_command_textbox.get('1.0', tk.END).strip()
+    if not live_check_enabled.get() or not player_code:
+        _discard_live_check()
+        return
+
+    _live_check_sequence += 1
+    inventory_snapshot = {item: data.copy() for item, data in inventory.items()}
+    customer_snapshot = None
+    if current_selected_customer_data:
+        customer_snapshot = copy_customer(current_selected_customer_data)
+    _live_check_jobs.put((_live_check_sequence, player_code, inventory_snapshot, balance, customer_snapshot))
+
+
+def _live_check_worker():
+    """
+    Checker thread: syntax-checks the newest job and re-runs the full verification
+    only when the code's AST (or the game state) changed since the last check.
+    The check itself runs in a worker process, which is killed if the player code never stops.
+    """
+    runner = CodeRunner("live-check")
+    previous_fingerprint = None
+    previous_result = None
+    while True:
+        job = _live_check_jobs.get()
+        try:
+            while True:  # Only the newest job matters
+                job = _live_check_jobs.get_nowait()
+        except queue.Empty:
+            pass
+
+        sequence, player_code, inventory_snapshot, balance_snapshot, customer_snapshot = job
+        try:
+            fingerprint, result = runner.call(LIVE_CHECK_TIME_LIMIT_SECONDS, live_check, player_code,
+                                              inventory_snapshot, balance_snapshot, customer_snapshot,
+                                              previous_fingerprint)
+        except CodeTimeoutError as e:
+            fingerprint, result = None, SubmissionResult(
+                "runtime_error", "Code Stopped",
+                f"{e} Is there an endless loop that catches every error (a bare 'except:')?")
+        except RuntimeError as e:
+            fingerprint, result = None, SubmissionResult("runtime_error", "Runtime Error", str(e))
+        if result is None:
+            result = previous_result  # Only whitespace/comments changed
+        previous_fingerprint, previous_result = fingerprint, result
+        _live_check_results.put((sequence, result))
+
+
+def _discard_live_check(status_text="", color="black"):
+    """Ignores any live check still in flight and shows 'status_text' instead."""
+    global _live_check_sequence
+
+    _live_check_sequence += 1
+    if live_check_status_label:
+        live_check_status_label.config(text=status_text, foreground=color)
+
+
+def poll_live_check_results():
+    """Runs on the Tk loop: shows the newest live check result under the python command box."""
+    latest = None
     try:
-        # Execute the player's code
-        exec(player_code, execution_globals, execution_locals)
-
-        # After execution, retrieve updated values from the execution environment
-        updated_inventory = execution_globals['inventory']
-        updated_balance = execution_globals['balance'][0]  # Get the value from the list wrapper
-
-        # --- VERIFICATION LOGIC ---
-        verification_passed = True
-        total_expected_gain = 0
-        customer_order_items = current_selected_customer_data['order']
-
-        # 1. Check if all ordered items were attempted to be deducted
-        for item, qty_ordered in customer_order_items.items():
-            # Check if item exists in game's master list (for price lookup)
-            if item not in ALL_GAME_ITEMS:
-                verification_passed = False
-                tkinter.messagebox.showerror("Code Error",
-                                             f"Logic Error: Customer ordered '{item}' which is not a recognized item in your shop's master list.")
-                break
-
-                # Check if player's code somehow removed the item from inventory dict, or bad key
-            if item not in updated_inventory or 'stock' not in updated_inventory[item]:
-                verification_passed = False
-                tkinter.messagebox.showerror("Code Error",
-                                             f"Logic Error: Your code removed '{item}' from inventory or corrupted its structure.")
-                break
-
-            # Check if original stock was sufficient for this order
-            original_stock_for_item = inventory.get(item, {}).get('stock', 0)
-            if original_stock_for_item < qty_ordered:
-                verification_passed = False
-                tkinter.messagebox.showerror("Code Error",
-                                             f"Logical Error: You tried to fulfill '{item}' ({qty_ordered}) but only had {original_stock_for_item} in stock originally. Cannot sell what you don't have!")
-                break
-
-                # Check if stock was correctly deducted
-            expected_stock_after_deduction = original_stock_for_item - qty_ordered
-            if updated_inventory[item]['stock'] != expected_stock_after_deduction:
-                verification_passed = False
-                tkinter.messagebox.showerror("Code Error",
-                                             f"Logic Error: Stock for '{item}' is incorrect.\nExpected: {expected_stock_after_deduction}, Actual: {updated_inventory[item]['stock']}\n(Did you use `-=` and the correct quantity?)")
-                break  # Stop if stock deduction is wrong
-
-            # Calculate expected gain
-            total_expected_gain += ALL_GAME_ITEMS[item]['price'] * qty_ordered
-
-        # 2. Check if final balance is correct (only if item deductions passed)
-        if verification_passed:
-            expected_balance_after_sale = balance + total_expected_gain
-            if updated_balance != expected_balance_after_sale:
-                verification_passed = False
-                tkinter.messagebox.showerror("Code Error",
-                                             f"Logic Error: Balance is incorrect.\nExpected: ₱{expected_balance_after_sale}, Actual: ₱{updated_balance}\n(Did you correctly calculate total earnings and use `balance[0] += amount`?)")
-
-        # 3. Check for unexpected deductions (player deducted items not in order, or extra items)
-        if verification_passed:
-            for item_name_in_inv, original_details in inventory.items():
-                original_stock = original_details['stock']
-                current_stock_after_player_code = updated_inventory.get(item_name_in_inv, {}).get('stock',
-                                                                                                  original_stock)
-
-                # If item was not in order but stock changed OR stock changed more than ordered
-                if (
-                        item_name_in_inv not in customer_order_items and current_stock_after_player_code != original_stock) or \
-                        (item_name_in_inv in customer_order_items and current_stock_after_player_code < (
-                                original_stock - customer_order_items[item_name_in_inv])):
-                    verification_passed = False
-                    tkinter.messagebox.showerror("Code Error",
-                                                 f"Logic Error: You deducted '{item_name_in_inv}' which was NOT in the customer's order, or you deducted too many items.")
-                    break  # Stop if unexpected deduction
-
-        # --- Final Outcome based on Verification ---
-        if verification_passed:
-            tkinter.messagebox.showinfo("Code Correct!",
-                                        "Your Python code executed successfully and the transaction logic is correct!\n\nNow, click 'Complete Sale' to finalize.")
-            # Apply changes to actual global game state immediately upon successful verification
-            inventory.update(updated_inventory)
-            balance = updated_balance
-
-            if btn_complete_sale_ref:
-                btn_complete_sale_ref.config(state='normal')  # Enable Complete Sale button
+        while True:
+            latest = _live_check_results.get_nowait()
+    except queue.Empty:
+        pass
+
+    if latest is not None and latest[0] == _live_check_sequence:
+        result = latest[1]
+        if result.verdict == "correct":
+            live_check_status_label.config(text="✓ Transaction looks correct. Click 'Run Code' to apply it.",
+                                           foreground="green")
+        elif result.verdict in ("syntax_ok", "bulk_ok"):
+            live_check_status_label.config(text=f"✓ {result.message}", foreground="green")
         else:
-            # If verification failed, the error message would have already been shown by messagebox.showerror
-            if btn_complete_sale_ref:
-                btn_complete_sale_ref.config(state='disabled')
-
-    except SyntaxError as e:
-        tkinter.messagebox.showerror("Syntax Error",
-                                     f"Your Python code has a SYNTAX ERROR:\n\n{e}\n\nPlease fix your code (check typos, missing colons, indentation).")
-        if btn_complete_sale_ref:
-            btn_complete_sale_ref.config(state='disabled')
-    except KeyError as e:
-        tkinter.messagebox.showerror("Key Error",
-                                     f"Your Python code has a KEY ERROR:\n\nYou tried to access an item or dictionary key that doesn't exist or is misspelled: {e}\n\nRemember to use exact item names like 'health potion' and correct dictionary keys like 'stock' or 'price'.")
-        if btn_complete_sale_ref:
-            btn_complete_sale_ref.config(state='disabled')
-    except TypeError as e:
-        tkinter.messagebox.showerror("Type Error",
-                                     f"Your Python code has a TYPE ERROR:\n\n{e}\n\nCheck if you're performing operations on the wrong type of data (e.g., adding a string to a number, or using `balance` without `[0]` if it's a list).")
-        if btn_complete_sale_ref:
-            btn_complete_sale_ref.config(state='disabled')
-    except Exception as e:
-        # Catch any other unexpected errors
-        tkinter.messagebox.showerror("Runtime Error",
-                                     f"An unexpected PYTHON RUNTIME ERROR occurred:\n\n{e}\n\nReview your code carefully.")
-        if btn_complete_sale_ref:
-            btn_complete_sale_ref.config(state='disabled')
+            # Show the detail paragraph of the error (the full text is in the Run Code dialog)
+            paragraphs = result.message.split("\n\n")
+            detail = paragraphs[1] if len(paragraphs) > 1 else paragraphs[0]
+            live_check_status_label.config(text=f"✗ {result.title}: {detail}", foreground="red")
 
+    live_check_status_label.after(LIVE_CHECK_POLL_MS, poll_live_check_results)
 
-# --- FUNCTIONS TO MANAGE UI STATE AND GAME PROGRESSION ---
 
-def reset_transaction_ui_and_customers():
+def update_completions(event=None):
+    """Bound to key releases in the python command box: shows, updates or hides the suggestion list."""
+    global _completion, _completion_chosen
+
+    if event is not None and event.keysym in COMPLETION_IGNORED_KEYS:
+        return
+    _completion = completion_index.suggest(python_command_textbox.get("insert linestart", "insert"))
+    cursor_box = python_command_textbox.bbox("insert")
+    if _completion is None or cursor_box is None:
+        hide_completions()
+        return
+
+    completion_listbox.delete(0, tk.END)
+    completion_listbox.insert(tk.END, *_completion.candidates)
+    completion_listbox.config(height=len(_completion.candidates))
+    completion_listbox.selection_set(0)
+    _completion_chosen = False
+    x, y, _, line_height = cursor_box
+    completion_listbox.place(x=x, y=y + line_height)
+
+
+def hide_completions(event=None):
+    """Closes the suggestion list (also bound to clicks in the python command box and to it losing focus)."""
+    global _completion
+
+    _completion = None
+    if completion_listbox:
+        completion_listbox.place_forget()
+
+
+def on_completion_key(event):
     """
-    Clears the Handle Order section, resets buttons, and refreshes customer display.
-    This is called after a successful 'Complete Sale'.
+    Bound to key presses in the python command box. While suggestions are shown,
+    Up/Down choose one, Tab inserts it, Return inserts it only if it was chosen with
+    Up/Down (otherwise it closes the list and starts a new line) and Escape closes the list.
     """
+    global _completion_chosen
+
+    if _completion is None:
+        return None
+    if event.keysym in ("Up", "Down"):
+        _completion_chosen = True
+        selection = completion_listbox.curselection()
+        index = (selection[0] if selection else 0) + (1 if event.keysym == "Down" else -1)
+        index = max(0, min(index, len(_completion.candidates) - 1))
+        completion_listbox.selection_clear(0, tk.END)
+        completion_listbox.selection_set(index)
+        completion_listbox.see(index)
+        return "break"
+    if event.keysym == "Return" and not _completion_chosen:
+        hide_completions()
+        return None
+    if event.keysym in ("Tab", "Return"):
+        accept_completion()
+        return "break"
+    if event.keysym == "Escape":
+        hide_completions()
+        return "break"
+    return None
+
+
+def on_completion_click(event):
+    """
+    Bound to clicks on the suggestion list: inserts the clicked suggestion. Returns "break" so
+    the list's own click handling does not take the focus away from the python command box.
+    """
+    index = completion_listbox.nearest(event.y)
+    completion_listbox.selection_clear(0, tk.END)
+    completion_listbox.selection_set(index)
+    accept_completion()
+    return "break"
+
+
+def accept_completion(event=None):
+    """Replaces the typed prefix with the selected suggestion (and closes the quote/bracket)."""
+    if _completion is None:
+        return
+    selection = completion_listbox.curselection()
+    candidate = _completion.candidates[selection[0] if selection else 0]
+    closing = _completion.closing
+    if closing and python_command_textbox.get("insert", f"insert + {len(closing)} chars") == closing:
+        closing = ""  # Already typed
+    python_command_textbox.delete(f"insert - {len(_completion.prefix)} chars", "insert")
+    python_command_textbox.insert("insert", candidate + closing)
+    hide_completions()
+    python_command_textbox.focus_set()
+    schedule_live_check()
+
+
+def _record_grading(verdict, grading_started, player_code, **fields):
+    """Records the verdict and grading latency of one 'Run Code' submission in the metrics and event log."""
+    latency = time.perf_counter() - grading_started
+    metrics.inc("verdicts_total", verdict=verdict)
+    metrics.observe("grading_latency_seconds", latency)
+    event_log.log("code_graded", verdict=verdict, latency_seconds=round(latency, 6),
+                  customer_id=current_selected_customer_data['id'], code=player_code, **fields)
+
+
+# --- FUNCTIONS TO MANAGE UI STATE AND GAME PROGRESSION ---
+
+def clear_transaction_ui():
+    """Clears the Handle Order section and forgets the selected customer."""
     global customer_order_display_textbox, python_command_textbox, btn_complete_sale_ref, all_serve_buttons
-    global current_selected_customer_data, active_customers
+    global current_selected_customer_data
 
     # 1. Clear Handle Order section UI
     if customer_order_display_textbox:
@@ -358,8 +486,9 @@ def reset_transaction_ui_and_customers():
         customer_order_display_textbox.config(state='disabled')
     if python_command_textbox:
         python_command_textbox.delete('1.0', tk.END)
-    if btn_complete_sale_ref:
-        btn_complete_sale_ref.config(state='disabled')  # Disable 'Complete Sale' again
+        hide_completions()
+        schedule_live_check()
+    set_sale_verified(False)  # Disable 'Complete Sale' again (and re-enable 'Run Code')
 
     # 2. Reset the currently selected customer data
     current_selected_customer_data = None
@@ -367,16 +496,55 @@ def reset_transaction_ui_and_customers():
     # 3. Reset all serve buttons to 'Serve' and ensure they are enabled (will be handled by populate_customer_cards)
     all_serve_buttons.clear()  # Clear references, as populate_customer_cards will recreate them
 
-    # 4. Bring in a new customer (if space allows, for actual gameplay)
-    if len(active_customers) < MAX_CUSTOMERS:  # Check if there's space for a new customer
+
+def expire_customers(ticks=1):
+    """
+    Moves the game clock forward 'ticks' completed sales. Customers whose patience ran out
+    leave the shop; returns them so the caller can tell the player and replace them.
+    """
+    left_customers = active_customers.advance(ticks)
+    for left_customer in left_customers:
+        event_log.log("customer_left", customer_id=left_customer['id'], name=left_customer['name'],
+                      reason="patience expired")
+    return left_customers
+
+
+def admit_customers(count):
+    """Brings in up to 'count' new customers, as long as there is room in the queue."""
+    for _ in range(min(count, MAX_CUSTOMERS - len(active_customers))):
         new_customer = generate_customer()
         if new_customer:
             active_customers.append(new_customer)
-            print(f"New customer '{new_customer['name']}' arrived!")
+            event_log.log("customer_arrived", customer_id=new_customer['id'], name=new_customer['name'])
+    metrics.set("queue_length", len(active_customers))
+
+
+def left_customers_text(left_customers):
+    """Message line telling the player who ran out of patience (empty if nobody left)."""
+    if not left_customers:
+        return ""
+    names = ", ".join(customer['name'] for customer in left_customers)
+    return f"\n\nRan out of patience and left: {names}"
+
+
+def reset_transaction_ui_and_customers(new_customers=1):
+    """
+    Clears the Handle Order section, resets buttons, and refreshes customer display.
+    This is called after a successful 'Complete Sale'; 'new_customers' is how many
+    customers arrive (one for the sale plus one for each customer who left).
+    """
+    # 1-3. Clear the Handle Order section, the selected customer and the serve buttons
+    clear_transaction_ui()
+
+    # 4. Bring in new customers (if space allows, for actual gameplay)
+    admit_customers(new_customers)
 
     # 5. Refresh the customer display (regenerate all customer cards based on active_customers)
     populate_customer_cards()
 
+    # 6. Refresh any sidebar panels that have been opened (inventory, sales)
+    refresh_open_panels()
+
 
 def complete_sale_command():
     """
@@ -387,17 +555,175 @@ def complete_sale_command():
     global active_customers, current_selected_customer_data
 
     if current_selected_customer_data:
-        # Find and remove the served customer from the active list
+        # Remove the served customer from the active queue
         customer_id_to_remove = current_selected_customer_data['id']
-        active_customers = [cust for cust in active_customers if cust['id'] != customer_id_to_remove]
+        active_customers.remove(customer_id_to_remove)
+
+        # Each completed sale is one game tick; customers whose patience ran out leave the shop
+        left_customers = expire_customers()
+
+        order = dict(current_selected_customer_data['order'])
+        sales_history.append({'name': current_selected_customer_data['name'], 'order': order,
+                              'total': sum(ALL_GAME_ITEMS[item]['price'] * qty for item, qty in order.items())})
+
+        metrics.inc("sales_completed_total")
+        metrics.set("queue_length", len(active_customers))
+        event_log.log("sale_completed", customer_id=customer_id_to_remove,
+                      name=current_selected_customer_data['name'], balance=balance)
+        tkinter.messagebox.showinfo("Sale Complete!", f"Successfully served {current_selected_customer_data['name']}!"
+                                                      f"{left_customers_text(left_customers)}")
+
+        # Reset the UI and bring in a new customer for the sale and for everyone who left
+        served_name = current_selected_customer_data['name']
+        reset_transaction_ui_and_customers(1 + len(left_customers))
+        record_game_version(f"Served {served_name}", changed_items=sale_changed_items)
+    else:
+        tkinter.messagebox.showwarning("No Active Transaction", "No customer selected or transaction in progress.")
+
+
+def serve_all_command():
+    """
+    Called when the 'Serve All' button is pressed. The code box must define
+    fulfill(order, inventory, balance) returning the new balance; it is run for every
+    waiting customer in service order (VIPs first), each order verified against the
+    stock left by the previous ones, and the result is reported in one summary.
+    The batch is graded in a worker process that is killed if it runs past its time limit,
+    so a fulfill() that never stops cannot freeze the window for longer than that.
+    """
+    global inventory, balance, active_customers
 
-        tkinter.messagebox.showinfo("Sale Complete!", f"Successfully served {current_selected_customer_data['name']}!")
-        print(f"Customer {current_selected_customer_data['name']} served and removed.")
+    player_code = python_command_textbox.get('1.0', tk.END).strip()
+    if not player_code:
+        tkinter.messagebox.showwarning("Empty Code", "Please enter a fulfill(order, inventory, balance) function first.")
+        return
+    if not len(active_customers):
+        tkinter.messagebox.showwarning("No Customers", "There are no customers waiting.")
+        return
+    if sale_in_progress():
+        # Run Code has already applied that customer's sale to the inventory and balance
+        tkinter.messagebox.showwarning("Sale In Progress", "Click 'Complete Sale' to finish the current sale first.")
+        return
 
-        # Reset the UI and potentially bring in new customers
-        reset_transaction_ui_and_customers()
+    grading_started = time.perf_counter()
+    metrics.inc("submissions_total")
+    customers = active_customers.first(len(active_customers))
+    time_limit = BULK_TIME_LIMIT_SECONDS + BULK_TIME_LIMIT_SECONDS_PER_ORDER * len(customers)
+    try:
+        result = serve_all_runner.call(time_limit, grade_bulk_submission, player_code, inventory, balance, customers)
+    except CodeTimeoutError as e:
+        result = BulkResult("runtime_error", "Code Stopped",
+                            f"{e}\n\nIs there an endless loop in fulfill() that catches every error "
+                            "(a bare 'except:')? Nobody was served.", [], [], [])
+    except RuntimeError as e:
+        result = BulkResult("runtime_error", "Runtime Error", f"{e}\n\nNobody was served.", [], [], [])
+
+    latency = time.perf_counter() - grading_started
+    metrics.inc("verdicts_total", verdict=result.verdict)
+    metrics.observe("grading_latency_seconds", latency)
+    event_log.log("bulk_graded", verdict=result.verdict, latency_seconds=round(latency, 6), code=player_code,
+                  customers=len(customers), served=result.served,
+                  skipped=[customer['id'] for customer, _ in result.skipped],
+                  failed=[customer['id'] for customer, _ in result.failed])
+
+    message = result.message
+    if result.served:
+        # Apply the whole batch, then finalize every served customer like 'Complete Sale' does
+        revenue = result.updated_balance - balance
+        changed_items = changed_inventory_items(result.updated_inventory)
+        inventory.update(result.updated_inventory)
+        balance = result.updated_balance
+        for customer_id in result.served:
+            customer = active_customers.remove(customer_id)
+            sales_history.append({'name': customer['name'], 'order': dict(customer['order']),
+                                  'total': sum(ALL_GAME_ITEMS[item]['price'] * qty
+                                               for item, qty in customer['order'].items())})
+        left_customers = expire_customers(len(result.served))  # One tick per sale
+        metrics.inc("revenue_total", revenue)
+        metrics.inc("sales_completed_total", len(result.served))
+
+        # New customers arrive (one per sale and one per customer who left, as with 'Complete Sale')
+        admit_customers(len(result.served) + len(left_customers))
+        message += left_customers_text(left_customers)
+
+        clear_transaction_ui()
+        populate_customer_cards()
+        record_game_version(f"Served {len(result.served)} customers (Serve All)", changed_items=changed_items)
+
+    if result.verdict == "correct":
+        tkinter.messagebox.showinfo(result.title, message)
+    elif result.served or result.failed:
+        tkinter.messagebox.showwarning(result.title, message)
     else:
-        tkinter.messagebox.showwarning("No Active Transaction", "No customer selected or transaction in progress.")
+        tkinter.messagebox.showerror(result.title, message)
+
+
+# --- UNDO / REDO / RESTORE TO TIME ---
+
+def record_game_version(label, changed_items=None):
+    """
+    Saves the current inventory, balance, customer queue and sales list as a new version in 'history'.
+    'changed_items' (optional) names the only inventory items that changed since the last version.
+    """
+    customers = {customer['id']: (customer, active_customers.deadline(customer['id']))
+                 for customer in active_customers}
+    version = history.commit(label, inventory, balance, customers, active_customers.current_tick,
+                             changed_items=changed_items, sales=sales_history)
+    event_log.log("version_recorded", version=version.number, label=label, balance=balance)
+    update_history_buttons()
+    refresh_open_panels()
+
+
+def restore_game_version(version, action):
+    """Replaces the live game state with a saved version (after undo/redo/restore)."""
+    global balance, active_customers
+
+    inventory.clear()
+    inventory.update({item_name: dict(details) for item_name, details in version.inventory.items()})
+    completion_index.sync_items(inventory)
+    balance = version.balance
+    sales_history[:] = version.sales  # Undone sales disappear from the Sales panel (and come back on redo)
+
+    active_customers = CustomerQueue()
+    active_customers.current_tick = version.tick
+    for customer, deadline in sorted(version.customers.values(), key=lambda entry: (entry[1], entry[0]['id'])):
+        active_customers.append(copy_customer(customer), deadline)  # The saved version keeps its own copy
+
+    # Any half-finished transaction belonged to the state we just left
+    clear_transaction_ui()
+    populate_customer_cards()
+    metrics.set("queue_length", len(active_customers))
+    event_log.log("state_restored", action=action, version=version.number, label=version.label, balance=balance)
+    update_history_buttons()
+    refresh_open_panels()
+
+
+def undo_command():
+    """Called by the 'Undo' button: goes back to the previous saved version."""
+    version = history.undo()
+    if version:
+        restore_game_version(version, "undo")
+
+
+def redo_command():
+    """Called by the 'Redo' button: goes forward again after an undo."""
+    version = history.redo()
+    if version:
+        restore_game_version(version, "redo")
+
+
+def restore_to_time_command(timestamp):
+    """Restores the game to how it was at 'timestamp' (used by the History panel)."""
+    version = history.restore_to_time(timestamp)
+    if version:
+        restore_game_version(version, "restore")
+
+
+def update_history_buttons():
+    """Enables/disables the Undo and Redo buttons."""
+    if btn_undo_ref:
+        btn_undo_ref.config(state='normal' if history.can_undo else 'disabled')
+    if btn_redo_ref:
+        btn_redo_ref.config(state='normal' if history.can_redo else 'disabled')
 
 
 def populate_customer_cards():
@@ -411,16 +737,17 @@ def populate_customer_cards():
     for widget in customer_cards_container.winfo_children():
         widget.destroy()
     all_serve_buttons.clear()  # Clear list of button references for new ones
+    customer_portrait_labels.clear()
 
     # Prepare list of customers to display (actual active + mock fillers)
-    display_customers_list = list(active_customers)  # Start with actual active customers
+    display_customers_list = active_customers.first(MAX_CUSTOMERS)  # Start with actual active customers, VIPs first
 
     # If active_customers is less than MAX_CUSTOMERS, fill remaining slots with mock data
     if len(display_customers_list) < MAX_CUSTOMERS:
         num_mock_needed = MAX_CUSTOMERS - len(display_customers_list)
         # Create a pool of mock customers not currently active to avoid ID conflicts for display
         # (This is just for UI display, not adding to actual game state yet)
-        available_mock = [c for c in mock_customers if c['id'] not in [ac['id'] for ac in active_customers]]
+        available_mock = [c for c in mock_customers if c['id'] not in active_customers]
         random.shuffle(available_mock)
         display_customers_list.extend(available_mock[:num_mock_needed])
 
@@ -445,7 +772,13 @@ def populate_customer_cards():
         if len(customer_data['order']) > 3:
             details_text += "  ..."
 
-        tk.Label(card, text=details_text, wraplength=120, justify="left").pack(expand=True, fill="both", padx=5, pady=2)
+        # The portrait is a shared image from the atlas (no per-card decoding); None until the atlas has loaded
+        details_label = tk.Label(card, text=details_text, wraplength=120, justify="left", compound="left")
+        portrait = portrait_atlas.get(customer_data['type'])
+        if portrait:
+            details_label.config(image=portrait)
+        details_label.pack(expand=True, fill="both", padx=5, pady=2)
+        customer_portrait_labels.append((details_label, customer_data['type']))
 
         # Create and configure the Serve Button
         serve_button = ttk.Button(card, text="Serve")
@@ -459,60 +792,13 @@ def populate_customer_cards():
         all_serve_buttons.append(serve_button)
 
 
-def create_main_ui():
-    # Declare global variables that will be assigned widget references within this function
-    global customer_order_display_textbox, python_command_textbox, btn_complete_sale_ref, all_serve_buttons, customer_cards_container
-
-    root = tk.Tk()
-    root.title("Script & Serve: Python Shop")
-    # --- GLOBAL WINDOW SIZE ---
-    root_width = 1200
-    root_height = 700
-    root.geometry(f"{root_width}x{root_height}")
-    root.resizable(False, False)  # Keep it fixed so user can't stretch it
-
-    # --- INITIAL GAME SETUP (Populate inventory and initial customers) ---
-    unlock_level_items(player_level, inventory)  # Populate initial inventory based on current level
-
-    # Initialize active_customers list with some random customers at startup
-    for _ in range(2):  # Start with 2 random customers in queue
-        new_customer = generate_customer()
-        if new_customer:
-            active_customers.append(new_customer)
-    # --- END INITIAL GAME SETUP ---
-
-    # --- CONFIGURATION VARIABLES (ADJUST THESE NUMBERS!) ---
-    # These are the main dimensions you'll change to customize the layout.
-
-    # 1. Left Sidebar
-    sidebar_width_config = 160  # Width of the left sidebar
-
-    # 2. Customers Section (at the bottom of the right side)
-    customers_height_config = 200  # Height of the entire customers panel
-
-    # 3. Handle Order Section (top right)
-    handle_order_width_config = 350  # Width of the "Handle Order" panel
-
-    # 4. Shop Image (the remaining space, but scaled to this size)
-    shop_img_display_width = 650  # Actual width the shop image will be drawn at
-    shop_img_display_height = 480  # Actual height the shop image will be drawn at
-
-    # --- END CONFIGURATION VARIABLES ---
-
-    # --- 1. Left Sidebar Frame ---
-    sidebar_frame = ttk.Frame(root, relief="solid", borderwidth=1, width=sidebar_width_config)
-    sidebar_frame.pack(side="left", fill="y", padx=5, pady=5)  # Packs to the left, fills vertical space
-    sidebar_frame.pack_propagate(False)  # Crucial: Prevents sidebar from resizing based on its contents
-
-    # --- Image Logo ---
-    logo_frame_size = 100
-    logo_frame = ttk.Frame(sidebar_frame, relief="flat", borderwidth=0,
-                           width=logo_frame_size, height=logo_frame_size)
-    logo_frame.pack(pady=15, padx=10, fill="x")
-    logo_frame.pack_propagate(False)
+# --- DEFERRED / LAZILY BUILT PARTS OF THE UI ---
 
+def load_logo_image(logo_frame):
+    """Loads the sidebar logo into logo_frame (scheduled after the window is shown)."""
+    logo_img_path = 'logo.png'  # Ensure this path is correct
     try:
-        logo_img_path = 'logo.png'  # Ensure this path is correct
+        Image, ImageTk = import_pil()
         logo_img = Image.open(logo_img_path)
         logo_display_size_in_frame = 80
         logo_img_resized = logo_img.resize((logo_display_size_in_frame, logo_display_size_in_frame),
@@ -530,104 +816,14 @@ def create_main_ui():
         placeholder_label = tk.Label(logo_frame, text=f"[Logo Error]\n{e}", fg="red")
         placeholder_label.pack(expand=True, fill="both")
 
-    # --- Sidebar Buttons ---
-    btn_inventory = ttk.Button(sidebar_frame, text="Inventory", width=15)
-    btn_inventory.pack(pady=5, padx=10)
-    btn_sales = ttk.Button(sidebar_frame, text="Sales", width=15)
-    btn_sales.pack(pady=5, padx=10)
-    btn_commands = ttk.Button(sidebar_frame, text="Commands", width=15)
-    btn_commands.pack(pady=5, padx=10)
-    ttk.Frame(sidebar_frame).pack(expand=True, fill="y")
-
-    # --- 2. Right Main Content Area ---
-    right_main_content_area_frame = ttk.Frame(root, relief="solid", borderwidth=1)
-    right_main_content_area_frame.pack(side="right", fill="both", expand=True, padx=5, pady=5)
-
-    # --- 2a. Customers Frame (Bottom of Right Main Content Area - Fixed Height) ---
-    customers_frame = ttk.Frame(right_main_content_area_frame, relief="solid", borderwidth=1,
-                                height=customers_height_config)
-    customers_frame.pack(side="bottom", fill="x", padx=5, pady=5)
-    customers_frame.pack_propagate(False)
-
-    lbl_customers_title = ttk.Label(customers_frame, text="Customers", font=("Arial", 12, "bold"))
-    lbl_customers_title.pack(side="top", anchor="w", padx=5, pady=2)
-
-    # This frame will hold the customer cards dynamically generated by populate_customer_cards()
-    customer_cards_container = ttk.Frame(customers_frame)  # <<< Assign to GLOBAL here
-    customer_cards_container.pack(fill="both", expand=True, padx=5, pady=5)
-
-    # --- Initial Customer Card Population ---
-    populate_customer_cards()  # Call to display the initial set of customers at startup
-
-    # --- 2b. Top Section (Shop Image & Handle Order) ---
-    top_section_frame = ttk.Frame(right_main_content_area_frame, relief="solid", borderwidth=1)
-    top_section_frame.pack(side="top", fill="both", expand=True, padx=5, pady=5)
-
-    # Grid config for top_section_frame (contains shop image and handle order side-by-side)
-    top_section_frame.grid_columnconfigure(0, weight=1)  # Shop Image column (flexible)
-    top_section_frame.grid_columnconfigure(1, weight=0)  # Handle Order column (fixed by width_config)
-    top_section_frame.grid_rowconfigure(0, weight=1)  # Only one row, flexible vertically
-
-    # --- 2b.i. Handle Order Frame (Top Right - Fixed Width) ---
-    handle_order_frame = ttk.Frame(top_section_frame, relief="ridge", borderwidth=2, width=handle_order_width_config)
-    handle_order_frame.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
-    handle_order_frame.grid_propagate(False)
-
-    # Internal grid for Handle Order frame content
-    handle_order_frame.grid_rowconfigure(0, weight=0)  # "Handle Order" label
-    handle_order_frame.grid_rowconfigure(1, weight=0)  # "Customer Order" label
-    handle_order_frame.grid_rowconfigure(2, weight=1)  # Customer Order Textbox (make it expand vertically)
-    handle_order_frame.grid_rowconfigure(3, weight=0)  # Python Instructions Label
-    handle_order_frame.grid_rowconfigure(4, weight=0)  # "Enter python command" label
-    handle_order_frame.grid_rowconfigure(5, weight=1)  # Python command Textbox (make it expand vertically)
-    handle_order_frame.grid_rowconfigure(6, weight=0)  # Run Code button
-    handle_order_frame.grid_rowconfigure(7, weight=0)  # Complete Sale button
-    handle_order_frame.grid_rowconfigure(8, weight=1)  # Spacer row at the bottom
-    handle_order_frame.grid_columnconfigure(0, weight=1)
-
-    lbl_handle_order = ttk.Label(handle_order_frame, text="Handle Order", font=("Arial", 14, "bold"))
-    lbl_handle_order.grid(row=0, column=0, pady=5)
-
-    # --- Customer Order Display Widgets ---
-    lbl_customer_order = ttk.Label(handle_order_frame, text="Customer Order")
-    lbl_customer_order.grid(row=1, column=0, sticky="nw", padx=10, pady=(0, 2))
-
-    customer_order_display_textbox = tk.Text(handle_order_frame, wrap="word", height=6)
-    customer_order_display_textbox.grid(row=2, column=0, sticky="nsew", padx=10, pady=5)
-    customer_order_display_textbox.config(state='disabled')
-
-    # --- Python Instructions Label ---
-    lbl_python_instructions = ttk.Label(handle_order_frame,
-                                        text="Instructions: Use 'inventory', 'balance', 'current_selected_customer_data' variables.\nExample: inventory['health potion']['stock'] -= 1",
-                                        wraplength=handle_order_width_config - 20,
-                                        justify="left",
-                                        font=("Arial", 8, "italic"))
-    lbl_python_instructions.grid(row=3, column=0, sticky="nw", padx=10, pady=(5, 2))
-
-    # --- Python Command Input ---
-    lbl_enter_command = ttk.Label(handle_order_frame, text="Enter python command")
-    lbl_enter_command.grid(row=4, column=0, sticky="nw", padx=10, pady=(0, 2))
-
-    python_command_textbox = tk.Text(handle_order_frame, wrap="word", height=10)
-    python_command_textbox.grid(row=5, column=0, sticky="nsew", padx=10, pady=5)
-
-    btn_run_code = ttk.Button(handle_order_frame, text="Run Code", command=run_code_command)
-    btn_run_code.grid(row=6, column=0, pady=5, sticky="ew", padx=10)
-
-    btn_complete_sale_ref = ttk.Button(handle_order_frame, text="Complete Sale",
-                                       command=complete_sale_command)  # Connected to function
-    btn_complete_sale_ref.grid(row=7, column=0, pady=5, sticky="ew", padx=10)
-    btn_complete_sale_ref.config(state='disabled')
-
-    # --- 2b.ii. Shop Image Frame (Top Left - Fills Remaining Space) ---
-    shop_image_frame = ttk.Frame(top_section_frame, relief="ridge", borderwidth=2)
-    shop_image_frame.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-
-    # --- Fixed Image Loading ---
+
+def load_shop_image(shop_image_frame, display_width, display_height):
+    """Loads the shop picture into shop_image_frame (scheduled after the window is shown)."""
     img_path = 'storeimage.jpg'  # Ensure this path is correct
     try:
+        Image, ImageTk = import_pil()
         original_img = Image.open(img_path)
-        resized_img = original_img.resize((shop_img_display_width, shop_img_display_height), Image.Resampling.NEAREST)
+        resized_img = original_img.resize((display_width, display_height), Image.Resampling.NEAREST)
         shop_image_tk = ImageTk.PhotoImage(resized_img)
 
         shop_image_label = tk.Label(shop_image_frame, image=shop_image_tk)
@@ -645,8 +841,390 @@ def create_main_ui():
                                      fg="red")
         placeholder_label.pack(expand=True, fill="both")
 
+
+def show_customer_portraits():
+    """Loads the portrait atlas and adds the portraits to the customer cards already on screen."""
+    if not portrait_atlas.load():
+        return
+    for details_label, customer_type in customer_portrait_labels:
+        if details_label.winfo_exists():
+            details_label.config(image=portrait_atlas.get(customer_type))
+
+
+def build_inventory_panel(window):
+    """Builds the Inventory panel; returns a function that refreshes its contents."""
+    table = ttk.Treeview(window, columns=("stock", "price", "restock_cost"), height=12)
+    table.heading("#0", text="Item")
+    table.heading("stock", text="Stock")
+    table.heading("price", text="Price")
+    table.heading("restock_cost", text="Restock Cost")
+    table.column("#0", width=180)
+    for column in ("stock", "price", "restock_cost"):
+        table.column(column, width=90, anchor="e")
+    table.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def refresh():
+        table.delete(*table.get_children())
+        for item_name, details in inventory.items():
+            table.insert("", "end", text=item_name.title(),
+                         values=(details['stock'], f"₱{details['price']}", f"₱{details['restock_cost']}"))
+
+    return refresh
+
+
+def build_sales_panel(window):
+    """Builds the Sales panel; returns a function that refreshes its contents."""
+    lbl_balance = ttk.Label(window, font=("Arial", 12, "bold"))
+    lbl_balance.pack(anchor="w", padx=10, pady=(10, 0))
+    table = ttk.Treeview(window, columns=("items", "total"), height=12)
+    table.heading("#0", text="Customer")
+    table.heading("items", text="Items")
+    table.heading("total", text="Total")
+    table.column("#0", width=180)
+    table.column("items", width=260)
+    table.column("total", width=80, anchor="e")
+    table.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def refresh():
+        lbl_balance.config(text=f"Balance: ₱{balance}    Sales: {len(sales_history)}")
+        table.delete(*table.get_children())
+        for sale in reversed(sales_history):  # Newest first
+            items_text = ", ".join(f"{qty} {item.title()}" for item, qty in sale['order'].items())
+            table.insert("", "end", text=sale['name'], values=(items_text, f"₱{sale['total']}"))
+
+    return refresh
+
+
+def build_history_panel(window):
+    """Builds the History panel (saved versions; restore any of them); returns its refresh function."""
+    table = ttk.Treeview(window, columns=("time", "balance", "customers"), height=12)
+    table.heading("#0", text="Version")
+    table.heading("time", text="Time")
+    table.heading("balance", text="Balance")
+    table.heading("customers", text="Waiting")
+    table.column("#0", width=220)
+    table.column("time", width=80)
+    table.column("balance", width=80, anchor="e")
+    table.column("customers", width=60, anchor="e")
+    table.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+
+    row_timestamps = {}  # Treeview row id -> timestamp of the version shown in that row
+
+    def restore_selected():
+        selection = table.selection()
+        if selection:
+            restore_to_time_command(row_timestamps[selection[0]])
+
+    ttk.Button(window, text="Restore to this point", command=restore_selected).pack(pady=(0, 10))
+
+    def refresh():
+        table.delete(*table.get_children())
+        row_timestamps.clear()
+        for version in reversed(list(history)):  # Newest first
+            marker = "▶ " if version is history.current else ""
+            row_id = table.insert("", "end", text=f"{marker}#{version.number} {version.label}",
+                         values=(time.strftime("%H:%M:%S", time.localtime(version.timestamp)),
+                                 f"₱{version.balance}", len(version.customers)))
+            row_timestamps[row_id] = version.timestamp
+
+    return refresh
+
+
+def build_commands_panel(window):
+    """Builds the Commands panel (what player code can use, incl. every item name); returns its refresh function."""
+    reference = tk.Text(window, wrap="word", height=24, width=70)
+    reference.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def refresh():
+        reference.config(state='normal')
+        reference.delete('1.0', tk.END)
+        reference.insert(tk.END, COMMANDS_REFERENCE_TEXT)
+        reference.insert(tk.END, "\nItem names in your shop:\n")
+        for item_name in completion_index.items:
+            reference.insert(tk.END, f"  '{item_name}'\n")
+        reference.config(state='disabled')
+
+    return refresh
+
+
+# Sidebar panels: name -> builder. Each panel is built the first time its button is clicked.
+PANEL_BUILDERS = {
+    "Inventory": build_inventory_panel,
+    "Sales": build_sales_panel,
+    "Commands": build_commands_panel,
+    "History": build_history_panel,
+}
+_open_panels = {}  # name -> (Toplevel window, refresh function or None)
+
+COMMANDS_REFERENCE_TEXT = """Variables your code can use:
+  inventory                        dict of item name -> {'stock', 'price', 'restock_cost'}
+  balance                          list holding your money: use balance[0]
+  current_selected_customer_data   the customer being served: 'name', 'type', 'order'
+
+Examples:
+  inventory['health potion']['stock'] -= 2
+  balance[0] += 2 * inventory['health potion']['price']
+
+  for item_name, quantity in current_selected_customer_data['order'].items():
+      inventory[item_name]['stock'] -= quantity
+      balance[0] += quantity * inventory[item_name]['price']
+
+Autocomplete: while you type in the python command box, matching item names,
+keys and variables are suggested (e.g. after inventory[' ). Tab inserts the first
+one; use Up/Down to pick another and Tab or Enter to insert it. Escape (or Enter
+without picking) closes the list.
+"""
+
+
+def show_panel(name):
+    """Shows a sidebar panel, building it on first use."""
+    window, refresh = _open_panels.get(name, (None, None))
+    if window is None or not window.winfo_exists():
+        with startup_profiler.phase(f"build {name} panel"):
+            window = tk.Toplevel()
+            window.title(f"Script & Serve: {name}")
+            window.protocol("WM_DELETE_WINDOW", window.withdraw)  # Keep it built for next time
+            refresh = PANEL_BUILDERS[name](window)
+            _open_panels[name] = (window, refresh)
+    if refresh:
+        refresh()
+    window.deiconify()
+    window.lift()
+
+
+def refresh_open_panels():
+    """Updates the contents of every panel that has been built (e.g. after a sale)."""
+    for window, refresh in _open_panels.values():
+        if refresh and window.winfo_exists():
+            refresh()
+
+
+def create_main_ui(profile_startup=False):
+    """
+    Builds and runs the game window. The window shell (sidebar, handle order panel and
+    customers) is built and shown first; images are loaded right after the first paint,
+    and the sidebar panels are only built when first opened.
+    """
+    # Declare global variables that will be assigned widget references within this function
+    global customer_order_display_textbox, python_command_textbox, btn_complete_sale_ref, all_serve_buttons, customer_cards_container
+    global live_check_enabled, live_check_status_label, btn_undo_ref, btn_redo_ref, completion_listbox, btn_run_code_ref
+
+    with startup_profiler.phase("create window"):
+        root = tk.Tk()
+        root.title("Script & Serve: Python Shop")
+        # --- GLOBAL WINDOW SIZE ---
+        root_width = 1200
+        root_height = 700
+        root.geometry(f"{root_width}x{root_height}")
+        root.resizable(False, False)  # Keep it fixed so user can't stretch it
+
+    # --- INITIAL GAME SETUP (Populate inventory and initial customers) ---
+    with startup_profiler.phase("initial game setup"):
+        unlock_level_items(player_level, inventory)  # Populate initial inventory based on current level
+
+        # Initialize active_customers list with some random customers at startup
+        for _ in range(2):  # Start with 2 random customers in queue
+            new_customer = generate_customer()
+            if new_customer:
+                active_customers.append(new_customer)
+        metrics.set("queue_length", len(active_customers))
+        record_game_version("Shop opened")
+    # --- END INITIAL GAME SETUP ---
+
+    # --- CONFIGURATION VARIABLES (ADJUST THESE NUMBERS!) ---
+    # These are the main dimensions you'll change to customize the layout.
+
+    # 1. Left Sidebar
+    sidebar_width_config = 160  # Width of the left sidebar
+    # 2. Customers Section (at the bottom of the right side)
+    customers_height_config = 200  # Height of the entire customers panel
+    # 3. Handle Order Section (top right)
+    handle_order_width_config = 350  # Width of the "Handle Order" panel
+
+    # 4. Shop Image (the remaining space, but scaled to this size)
+    shop_img_display_width = 650  # Actual width the shop image will be drawn at
+    shop_img_display_height = 480  # Actual height the shop image will be drawn at
+
+    # --- END CONFIGURATION VARIABLES ---
+
+    with startup_profiler.phase("build sidebar"):
+        # --- 1. Left Sidebar Frame ---
+        sidebar_frame = ttk.Frame(root, relief="solid", borderwidth=1, width=sidebar_width_config)
+        sidebar_frame.pack(side="left", fill="y", padx=5, pady=5)  # Packs to the left, fills vertical space
+        sidebar_frame.pack_propagate(False)  # Crucial: Prevents sidebar from resizing based on its contents
+
+        # --- Image Logo (the image itself is loaded after the window is shown) ---
+        logo_frame_size = 100
+        logo_frame = ttk.Frame(sidebar_frame, relief="flat", borderwidth=0,
+                               width=logo_frame_size, height=logo_frame_size)
+        logo_frame.pack(pady=15, padx=10, fill="x")
+        logo_frame.pack_propagate(False)
+
+        # --- Sidebar Buttons (their panels are built on first click) ---
+        btn_inventory = ttk.Button(sidebar_frame, text="Inventory", width=15,
+                                   command=lambda: show_panel("Inventory"))
+        btn_inventory.pack(pady=5, padx=10)
+        btn_sales = ttk.Button(sidebar_frame, text="Sales", width=15, command=lambda: show_panel("Sales"))
+        btn_sales.pack(pady=5, padx=10)
+        btn_commands = ttk.Button(sidebar_frame, text="Commands", width=15, command=lambda: show_panel("Commands"))
+        btn_commands.pack(pady=5, padx=10)
+        btn_history = ttk.Button(sidebar_frame, text="History", width=15, command=lambda: show_panel("History"))
+        btn_history.pack(pady=5, padx=10)
+
+        # --- Undo / Redo (whole game state: inventory, balance and waiting customers) ---
+        undo_redo_frame = ttk.Frame(sidebar_frame)
+        undo_redo_frame.pack(pady=5, padx=10)
+        btn_undo_ref = ttk.Button(undo_redo_frame, text="Undo", width=7, command=undo_command)
+        btn_undo_ref.pack(side="left")
+        btn_redo_ref = ttk.Button(undo_redo_frame, text="Redo", width=7, command=redo_command)
+        btn_redo_ref.pack(side="left")
+        update_history_buttons()
+        ttk.Frame(sidebar_frame).pack(expand=True, fill="y")
+
+    with startup_profiler.phase("build customers panel"):
+        # --- 2. Right Main Content Area ---
+        right_main_content_area_frame = ttk.Frame(root, relief="solid", borderwidth=1)
+        right_main_content_area_frame.pack(side="right", fill="both", expand=True, padx=5, pady=5)
+
+        # --- 2a. Customers Frame (Bottom of Right Main Content Area - Fixed Height) ---
+        customers_frame = ttk.Frame(right_main_content_area_frame, relief="solid", borderwidth=1,
+                                    height=customers_height_config)
+        customers_frame.pack(side="bottom", fill="x", padx=5, pady=5)
+        customers_frame.pack_propagate(False)
+
+        lbl_customers_title = ttk.Label(customers_frame, text="Customers", font=("Arial", 12, "bold"))
+        lbl_customers_title.pack(side="top", anchor="w", padx=5, pady=2)
+
+        # This frame will hold the customer cards dynamically generated by populate_customer_cards()
+        customer_cards_container = ttk.Frame(customers_frame)  # <<< Assign to GLOBAL here
+        customer_cards_container.pack(fill="both", expand=True, padx=5, pady=5)
+
+        # --- Initial Customer Card Population ---
+        populate_customer_cards()  # Call to display the initial set of customers at startup
+
+    with startup_profiler.phase("build handle order panel"):
+        # --- 2b. Top Section (Shop Image & Handle Order) ---
+        top_section_frame = ttk.Frame(right_main_content_area_frame, relief="solid", borderwidth=1)
+        top_section_frame.pack(side="top", fill="both", expand=True, padx=5, pady=5)
+
+        # Grid config for top_section_frame (contains shop image and handle order side-by-side)
+        top_section_frame.grid_columnconfigure(0, weight=1)  # Shop Image column (flexible)
+        top_section_frame.grid_columnconfigure(1, weight=0)  # Handle Order column (fixed by width_config)
+        top_section_frame.grid_rowconfigure(0, weight=1)  # Only one row, flexible vertically
+
+        # --- 2b.i. Handle Order Frame (Top Right - Fixed Width) ---
+        handle_order_frame = ttk.Frame(top_section_frame, relief="ridge", borderwidth=2,
+                                       width=handle_order_width_config)
+        handle_order_frame.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
+        handle_order_frame.grid_propagate(False)
+
+        # Internal grid for Handle Order frame content
+        handle_order_frame.grid_rowconfigure(0, weight=0)  # "Handle Order" label
+        handle_order_frame.grid_rowconfigure(1, weight=0)  # "Customer Order" label
+        handle_order_frame.grid_rowconfigure(2, weight=1)  # Customer Order Textbox (make it expand vertically)
+        handle_order_frame.grid_rowconfigure(3, weight=0)  # Python Instructions Label
+        handle_order_frame.grid_rowconfigure(4, weight=0)  # "Enter python command" label
+        handle_order_frame.grid_rowconfigure(5, weight=1)  # Python command Textbox (make it expand vertically)
+        handle_order_frame.grid_rowconfigure(6, weight=0)  # Live check status label
+        handle_order_frame.grid_rowconfigure(7, weight=0)  # Run Code button
+        handle_order_frame.grid_rowconfigure(8, weight=0)  # Complete Sale button
+        handle_order_frame.grid_rowconfigure(9, weight=0)  # Serve All button
+        handle_order_frame.grid_rowconfigure(10, weight=1)  # Spacer row at the bottom
+        handle_order_frame.grid_columnconfigure(0, weight=1)
+
+        lbl_handle_order = ttk.Label(handle_order_frame, text="Handle Order", font=("Arial", 14, "bold"))
+        lbl_handle_order.grid(row=0, column=0, pady=5)
+
+        # --- Customer Order Display Widgets ---
+        lbl_customer_order = ttk.Label(handle_order_frame, text="Customer Order")
+        lbl_customer_order.grid(row=1, column=0, sticky="nw", padx=10, pady=(0, 2))
+
+        customer_order_display_textbox = tk.Text(handle_order_frame, wrap="word", height=6)
+        customer_order_display_textbox.grid(row=2, column=0, sticky="nsew", padx=10, pady=5)
+        customer_order_display_textbox.config(state='disabled')
+
+        # --- Python Instructions Label ---
+        lbl_python_instructions = ttk.Label(handle_order_frame,
+                                            text="Instructions: Use 'inventory', 'balance', 'current_selected_customer_data' variables.\nExample: inventory['health potion']['stock'] -= 1",
+                                            wraplength=handle_order_width_config - 20,
+                                            justify="left",
+                                            font=("Arial", 8, "italic"))
+        lbl_python_instructions.grid(row=3, column=0, sticky="nw", padx=10, pady=(5, 2))
+
+        # --- Python Command Input ---
+        lbl_enter_command = ttk.Label(handle_order_frame, text="Enter python command")
+        lbl_enter_command.grid(row=4, column=0, sticky="nw", padx=10, pady=(0, 2))
+
+        live_check_enabled = tk.BooleanVar(value=True)
+        chk_live_check = ttk.Checkbutton(handle_order_frame, text="Live check", variable=live_check_enabled,
+                                         command=schedule_live_check)
+        chk_live_check.grid(row=4, column=0, sticky="ne", padx=10, pady=(0, 2))
+
+        python_command_textbox = tk.Text(handle_order_frame, wrap="word", height=10)
+        python_command_textbox.grid(row=5, column=0, sticky="nsew", padx=10, pady=5)
+        python_command_textbox.bind("<KeyRelease>", schedule_live_check)  # Debounced syntax/verification check
+        python_command_textbox.bind("<KeyRelease>", update_completions, add="+")  # Autocomplete suggestions
+        python_command_textbox.bind("<KeyPress>", on_completion_key)  # Up/Down/Tab/Return/Escape while suggesting
+        # A click moves the cursor away from the typed prefix, so the suggestions no longer apply
+        python_command_textbox.bind("<Button-1>", hide_completions, add="+")
+        python_command_textbox.bind("<FocusOut>", hide_completions, add="+")
+
+        # Suggestion list, placed under the cursor inside the python command box by update_completions()
+        completion_listbox = tk.Listbox(python_command_textbox, exportselection=False, takefocus=0,
+                                        activestyle="none")
+        completion_listbox.bind("<Button-1>", on_completion_click)
+
+        # --- Live Check Status (inline feedback while typing) ---
+        live_check_status_label = ttk.Label(handle_order_frame, text="", wraplength=handle_order_width_config - 20,
+                                            justify="left", font=("Arial", 8))
+        live_check_status_label.grid(row=6, column=0, sticky="nw", padx=10)
+        threading.Thread(target=_live_check_worker, name="live-check", daemon=True).start()
+        poll_live_check_results()
+
+        btn_run_code_ref = ttk.Button(handle_order_frame, text="Run Code", command=run_code_command)
+        btn_run_code_ref.grid(row=7, column=0, pady=5, sticky="ew", padx=10)
+
+        btn_complete_sale_ref = ttk.Button(handle_order_frame, text="Complete Sale",
+                                           command=complete_sale_command)  # Connected to function
+        btn_complete_sale_ref.grid(row=8, column=0, pady=5, sticky="ew", padx=10)
+        btn_complete_sale_ref.config(state='disabled')
+
+        # Bulk mode: runs fulfill(order, inventory, balance) from the code box for every waiting customer
+        btn_serve_all = ttk.Button(handle_order_frame, text="Serve All (def fulfill)", command=serve_all_command)
+        btn_serve_all.grid(row=9, column=0, pady=5, sticky="ew", padx=10)
+
+        # --- 2b.ii. Shop Image Frame (Top Left - Fills Remaining Space, image loaded after first paint) ---
+        shop_image_frame = ttk.Frame(top_section_frame, relief="ridge", borderwidth=2)
+        shop_image_frame.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
+
+    # --- Show the window shell now, then fill in the images ---
+    with startup_profiler.phase("first paint"):
+        root.update()
+    startup_profiler.mark("window shown")
+
+    def load_deferred_images():
+        with startup_profiler.phase("load logo"):
+            load_logo_image(logo_frame)
+        with startup_profiler.phase("load shop image"):
+            load_shop_image(shop_image_frame, shop_img_display_width, shop_img_display_height)
+        with startup_profiler.phase("load customer portraits"):
+            show_customer_portraits()
+        startup_profiler.mark("startup complete")
+        if profile_startup:
+            print(startup_profiler.report())
+
+    root.after_idle(load_deferred_images)
     root.mainloop()
 
 
 if __name__ == "__main__":
-    create_main_ui()
\ No newline at end of file
+    if getattr(sys, "frozen", False):
+        # In a PyInstaller build the code runner's worker process starts this executable again;
+        # freeze_support() turns that start into the worker instead of a second game window
+        import multiprocessing
+        multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Script & Serve: Python Shop")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print how long each import and UI construction phase took at launch.")
+    args = parser.parse_args()
+    create_main_ui(profile_startup=args.profile_startup)
@@ -0,0 +1,75 @@
+"""
+Customer portraits, cut from one sprite atlas (portraits.png).
+
+The atlas is decoded once, the first time portraits are needed, and every tile
+is turned into a single ImageTk.PhotoImage that all customer cards of that type
+share. Building a card then only references an existing image, so card creation
+time and memory stay the same however many customers come and go.
+"""
+
+PORTRAIT_ATLAS_PATH = 'portraits.png'
+PORTRAIT_TILE_SIZE = 64  # Size of one tile in the atlas (pixels)
+PORTRAIT_ATLAS_COLUMNS = 4
+PORTRAIT_DISPLAY_SIZE = 48  # Size the portraits are shown at on customer cards
+DEFAULT_PORTRAIT = "default"  # Tile used for customer types without their own portrait
+
+# Tile order in the atlas: left to right, top to bottom
+PORTRAIT_TILES = ("Knight", "Mage", "Raider", "Noble", "Merchant", "Warrior", "Evil", DEFAULT_PORTRAIT)
+
+
+def import_pil():
+    """
+    Imports Pillow on first use and returns (Image, ImageTk). Pillow is the slowest import
+    and only needed for images, so it is kept off the startup path.
+    """
+    from PIL import Image, ImageTk
+    return Image, ImageTk
+
+
+class PortraitAtlas:
+    """Shared portrait images keyed by customer type."""
+
+    def __init__(self, path=PORTRAIT_ATLAS_PATH, display_size=PORTRAIT_DISPLAY_SIZE):
+        self.path = path
+        self.display_size = display_size
+        self._photos = {}  # customer type -> ImageTk.PhotoImage
+        self.loaded = False
+        self.error = None  # Why the atlas could not be loaded (portraits are then left out)
+
+    def load(self):
+        """
+        Decodes the atlas and slices it into one PhotoImage per tile (needs a Tk root window).
+        Safe to call more than once; returns True if the portraits are available.
+        """
+        if self.loaded or self.error:
+            return self.loaded
+        try:
+            Image, ImageTk = import_pil()
+            with Image.open(self.path) as atlas:
+                atlas = atlas.convert("RGBA")
+            for index, customer_type in enumerate(PORTRAIT_TILES):
+                left = (index % PORTRAIT_ATLAS_COLUMNS) * PORTRAIT_TILE_SIZE
+                top = (index // PORTRAIT_ATLAS_COLUMNS) * PORTRAIT_TILE_SIZE
+                tile = atlas.crop((left, top, left + PORTRAIT_TILE_SIZE, top + PORTRAIT_TILE_SIZE))
+                if self.display_size != PORTRAIT_TILE_SIZE:
+                    tile = tile.resize((self.display_size, self.display_size), Image.Resampling.NEAREST)
+                self._photos[customer_type] = ImageTk.PhotoImage(tile)
+        except Exception as e:
+            print(f"Error loading customer portraits from '{self.path}': {e}")
+            self.error = e
+            self._photos.clear()
+            return False
+        self.loaded = True
+        return True
+
+    def get(self, customer_type):
+        """
+        Returns the shared PhotoImage for 'customer_type' (the default portrait for unknown
+        types), or None while the atlas is not loaded.
+        """
+        if not self.loaded:
+            return None
+        return self._photos.get(customer_type) or self._photos[DEFAULT_PORTRAIT]
+
+    def __len__(self):
+        return len(self._photos)
@@ -0,0 +1,168 @@
+"""
+Shared-memory item catalog and counter tables for the multi-process simulation tools
+(simulation.py and balancer.py). Kept out of game_state so the game itself never
+imports multiprocessing.
+"""
+import os
+import struct
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+
+from game_state import ALL_GAME_ITEMS
+
+# --- SHARED-MEMORY BACKING (for multi-process simulation workers) ---
+# Catalog block layout: header (item count, names blob length) followed by
+# [price, restock_cost] int64 pairs per item, then the item names as one UTF-8 blob
+# separated by NUL bytes.
+_CATALOG_HEADER = struct.Struct("qq")
+_INT64 = struct.Struct("q")
+
+
+def _attach_shared_memory(name):
+    """Opens an existing shared memory block without making this process responsible for deleting it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        # Older versions register the block with the resource tracker on attach. Worker processes
+        # share their parent's tracker, so that registration is a no-op and the parent's unlink()
+        # still cleans it up.
+        return shared_memory.SharedMemory(name=name)
+
+
+def prepare_worker_processes():
+    """
+    Call before starting a process pool that will attach to shared memory blocks created later.
+    Starts the resource tracker now so forked workers share it with this process; otherwise each
+    worker starts its own tracker, which reports the blocks as leaked (and tries to delete them)
+    when the worker exits.
+    """
+    if os.name == "posix":
+        resource_tracker.ensure_running()
+
+
+class SharedCatalog(Mapping):
+    """
+    Read-only item catalog (name -> {'price', 'restock_cost'}) stored in shared memory.
+
+    The parent process creates it once with SharedCatalog.create(); workers open it
+    by name with SharedCatalog.attach(), which maps the existing block instead of
+    rebuilding or unpickling the catalog.
+    """
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self._owner = owner
+        item_count, names_length = _CATALOG_HEADER.unpack_from(shm.buf, 0)
+        values_offset = _CATALOG_HEADER.size
+        names_offset = values_offset + item_count * 2 * _INT64.size
+        names_blob = bytes(shm.buf[names_offset:names_offset + names_length])
+        self._names = names_blob.decode("utf-8").split("\0") if item_count else []
+        self._index = {name: i for i, name in enumerate(self._names)}
+        self._values = shm.buf[values_offset:names_offset].cast("q")  # [price0, restock0, price1, ...]
+
+    @classmethod
+    def create(cls, items=None):
+        """Copies 'items' (defaults to ALL_GAME_ITEMS) into a new shared memory block."""
+        items = ALL_GAME_ITEMS if items is None else items
+        names = list(items)
+        names_blob = "\0".join(names).encode("utf-8")
+        values_size = len(names) * 2 * _INT64.size
+        size = _CATALOG_HEADER.size + values_size + len(names_blob)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+        _CATALOG_HEADER.pack_into(shm.buf, 0, len(names), len(names_blob))
+        offset = _CATALOG_HEADER.size
+        for name in names:
+            struct.pack_into("qq", shm.buf, offset, items[name]["price"], items[name]["restock_cost"])
+            offset += 2 * _INT64.size
+        shm.buf[offset:offset + len(names_blob)] = names_blob
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Opens a catalog created by another process."""
+        return cls(_attach_shared_memory(name), owner=False)
+
+    @property
+    def name(self):
+        """Shared memory block name to pass to worker processes."""
+        return self._shm.name
+
+    def __getitem__(self, item_name):
+        i = self._index[item_name]
+        return {"price": self._values[2 * i], "restock_cost": self._values[2 * i + 1]}
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def close(self):
+        """Detaches from the block (and deletes it if this process created it)."""
+        self._values.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class SharedCounters:
+    """
+    Table of int64 counters in shared memory: one row per worker, one column per field.
+
+    Each worker only ever writes its own row, so no locking is needed; the parent
+    sums the rows with totals() once the workers are done.
+    """
+
+    def __init__(self, shm, fields, rows, owner):
+        self._shm = shm
+        self._owner = owner
+        self.fields = tuple(fields)
+        self.rows = rows
+        self._columns = {field: i for i, field in enumerate(self.fields)}
+        self._values = shm.buf[:rows * len(self.fields) * _INT64.size].cast("q")
+
+    @classmethod
+    def create(cls, fields, rows):
+        """Allocates a zeroed rows x len(fields) counter table."""
+        shm = shared_memory.SharedMemory(create=True, size=max(rows * len(fields) * _INT64.size, 1))
+        shm.buf[:rows * len(fields) * _INT64.size] = bytes(rows * len(fields) * _INT64.size)
+        return cls(shm, fields, rows, owner=True)
+
+    @classmethod
+    def attach(cls, name, fields, rows):
+        """Opens a counter table created by another process."""
+        return cls(_attach_shared_memory(name), fields, rows, owner=False)
+
+    @property
+    def name(self):
+        """Shared memory block name to pass to worker processes."""
+        return self._shm.name
+
+    def add(self, row, field, amount=1):
+        self._values[row * len(self.fields) + self._columns[field]] += amount
+
+    def add_all(self, row, amounts):
+        """Adds a {field: amount} dict to one row (workers call this once per batch)."""
+        base = row * len(self.fields)
+        for field, amount in amounts.items():
+            self._values[base + self._columns[field]] += amount
+
+    def row(self, row):
+        """Returns one worker's counters as a {field: value} dict."""
+        base = row * len(self.fields)
+        return {field: self._values[base + i] for i, field in enumerate(self.fields)}
+
+    def totals(self, rows=None):
+        """Returns every field summed over all rows (or only over the given row numbers)."""
+        width = len(self.fields)
+        if rows is None:
+            return {field: sum(self._values[i::width]) for i, field in enumerate(self.fields)}
+        return {field: sum(self._values[row * width + i] for row in rows) for i, field in enumerate(self.fields)}
+
+    def close(self):
+        """Detaches from the block (and deletes it if this process created it)."""
+        self._values.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
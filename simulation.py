@@ -0,0 +1,261 @@
+"""
+Headless shop simulation for balance sweeps.
+
+Simulated players run shop sessions with the real game rules: orders come from
+customer_manager.generate_order (the same generator the GUI's generate_customer
+uses) and every sale is graded by transaction_manager.verify_transaction.
+
+Worker processes read the item catalog from a SharedCatalog and report their
+totals into their own row of a SharedCounters table, so starting a worker only
+means attaching to two shared memory blocks, and nothing is pickled on the way back.
+
+Usage:
+    python simulation.py --workers 4 --sessions 2000
+    python simulation.py --scaling --workers 8
+"""
+import argparse
+import bisect
+import multiprocessing
+import os
+import random
+import time
+
+from customer_manager import generate_order
+from game_state import (LEVEL_ITEM_UNLOCKS, LEVEL_UP_COSTS, ORDER_ITEM_COUNT_RANGE, ORDER_QUANTITY_RANGE,
+                        STARTING_BALANCE)
+from shared_state import SharedCatalog, SharedCounters
+from transaction_manager import verify_transaction
+
+SESSION_LENGTH = 200  # Customers per simulated player session
+RESTOCK_TARGET = 10  # Simulated players restock a short item up to this many units
+
+
+def _geometric_bounds(start, stop, ratio):
+    """Integer bucket bounds from 'start' up to at least 'stop', each about 'ratio' times the last."""
+    bounds = [start]
+    while bounds[-1] < stop:
+        bounds.append(max(bounds[-1] + 1, round(bounds[-1] * ratio)))
+    return tuple(bounds)
+
+
+# Histogram bucket upper bounds for per-session distributions (a final bucket catches everything above).
+# The buckets are kept narrow so the reported percentiles can tell balancing candidates apart.
+REVENUE_BUCKETS = _geometric_bounds(1000, 5_000_000, 1.1)  # ₱1,000 .. ~₱5,000,000 earned per session, 10% apart
+# One bucket per customer within a default session, then 10% steps for longer --session-length runs
+TICKS_BUCKETS = tuple(range(1, SESSION_LENGTH)) + _geometric_bounds(SESSION_LENGTH, 10 * SESSION_LENGTH, 1.1)
+
+
+def _bucket_fields(prefix, bounds):
+    return tuple(f"{prefix}_le_{bound}" for bound in bounds) + (f"{prefix}_gt_{bounds[-1]}",)
+
+
+def _bucket_field(prefix, bounds, value):
+    """Name of the histogram field that 'value' falls into."""
+    index = bisect.bisect_left(bounds, value)
+    if index < len(bounds):
+        return f"{prefix}_le_{bounds[index]}"
+    return f"{prefix}_gt_{bounds[-1]}"
+
+
+def histogram_percentile(totals, prefix, bounds, fraction):
+    """
+    Estimates a percentile from histogram counters: returns the upper bound of the bucket
+    holding the 'fraction' quantile (None if the histogram is empty, inf for the overflow bucket).
+    """
+    fields = _bucket_fields(prefix, bounds)
+    count = sum(totals[field] for field in fields)
+    if not count:
+        return None
+    seen = 0
+    for bound, field in zip(bounds + (float("inf"),), fields):
+        seen += totals[field]
+        if seen >= fraction * count:
+            return bound
+    return float("inf")
+
+
+# Counters each worker reports (one shared-memory row per worker)
+STAT_FIELDS = (
+    "sessions",
+    "customers",
+    "served",
+    "stockouts",  # Customers turned away because an item could not be stocked
+    "verification_failures",
+    "revenue",
+    "restock_spend",
+    "level_ups",
+) + tuple(f"reached_level_{level}" for level in sorted(LEVEL_UP_COSTS)) \
+  + tuple(f"ticks_to_level_{level}" for level in sorted(LEVEL_UP_COSTS)) \
+  + _bucket_fields("session_revenue", REVENUE_BUCKETS) \
+  + tuple(field for level in sorted(LEVEL_UP_COSTS) for field in _bucket_fields(f"level_{level}_ticks", TICKS_BUCKETS))
+# ticks_to_level_N is summed over the sessions that reached level N; the *_le_*/*_gt_* fields are histograms
+
+
+def unlock_items(level, inventory, catalog):
+    """Adds the items unlocked at 'level' to a simulated inventory (like main.unlock_level_items)."""
+    for item_name, initial_details in LEVEL_ITEM_UNLOCKS.get(level, {}).items():
+        if item_name not in inventory:
+            inventory[item_name] = {"stock": initial_details["stock"], **catalog[item_name]}
+
+
+def simulate_session(catalog, rng, stats, session_length=SESSION_LENGTH, level_up_costs=LEVEL_UP_COSTS,
+                     item_count_range=ORDER_ITEM_COUNT_RANGE, quantity_range=ORDER_QUANTITY_RANGE,
+                     restock_target=RESTOCK_TARGET):
+    """
+    Plays one session of 'session_length' customers and adds the outcome to the 'stats' dict.
+
+    The simulated player restocks ordered items that are short (if they can afford it),
+    turns the customer away if stock is still short, otherwise performs the sale exactly
+    as correct player code would and has it graded by verify_transaction. They level up
+    (paying the level-up cost) as soon as their balance allows it.
+    """
+    inventory = {}
+    level = 1
+    unlock_items(level, inventory, catalog)
+    balance = STARTING_BALANCE
+    session_revenue = 0
+    stats["sessions"] += 1
+
+    for tick in range(1, session_length + 1):
+        order = generate_order(inventory, rng, item_count_range, quantity_range)
+        stats["customers"] += 1
+
+        # Restock anything the order needs more of
+        for item, qty in order.items():
+            record = inventory[item]
+            if record["stock"] < qty:
+                units = max(restock_target, qty) - record["stock"]
+                cost = units * record["restock_cost"]
+                if cost <= balance:
+                    balance -= cost
+                    record["stock"] += units
+                    stats["restock_spend"] += cost
+
+        if any(inventory[item]["stock"] < qty for item, qty in order.items()):
+            stats["stockouts"] += 1
+            continue
+
+        # What correct player code does, on a copy, then graded like a real submission
+        updated_inventory = {item: data.copy() for item, data in inventory.items()}
+        updated_balance = balance
+        for item, qty in order.items():
+            updated_inventory[item]["stock"] -= qty
+            updated_balance += qty * updated_inventory[item]["price"]
+        if verify_transaction(inventory, updated_inventory, balance, updated_balance, order, catalog) is not None:
+            stats["verification_failures"] += 1
+            continue
+
+        stats["served"] += 1
+        session_revenue += updated_balance - balance
+        inventory, balance = updated_inventory, updated_balance
+
+        next_level_cost = level_up_costs.get(level + 1)
+        if next_level_cost is not None and balance >= next_level_cost:
+            balance -= next_level_cost
+            level += 1
+            unlock_items(level, inventory, catalog)
+            stats["level_ups"] += 1
+            stats[f"reached_level_{level}"] += 1
+            stats[f"ticks_to_level_{level}"] += tick
+            stats[_bucket_field(f"level_{level}_ticks", TICKS_BUCKETS, tick)] += 1
+
+    stats["revenue"] += session_revenue
+    stats[_bucket_field("session_revenue", REVENUE_BUCKETS, session_revenue)] += 1
+
+
+def simulate_chunk(catalog_name, counters_name, rows, row, sessions, session_length=SESSION_LENGTH, seed=0,
+                   level_up_costs=LEVEL_UP_COSTS, item_count_range=ORDER_ITEM_COUNT_RANGE,
+                   quantity_range=ORDER_QUANTITY_RANGE):
+    """
+    Worker task: runs 'sessions' sessions against the shared catalog and adds the totals to
+    row 'row' of the shared counter table. Only names and a few numbers cross the process
+    boundary; the catalog is read from and the results written to shared memory.
+    """
+    catalog = SharedCatalog.attach(catalog_name)
+    counters = SharedCounters.attach(counters_name, STAT_FIELDS, rows)
+    try:
+        rng = random.Random(seed)
+        stats = dict.fromkeys(STAT_FIELDS, 0)
+        for _ in range(sessions):
+            simulate_session(catalog, rng, stats, session_length, level_up_costs, item_count_range, quantity_range)
+        counters.add_all(row, stats)
+    finally:
+        counters.close()
+        catalog.close()
+
+
+def split_evenly(total, parts):
+    """Splits 'total' into 'parts' integers that differ by at most one."""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def run_simulation(sessions, workers=1, session_length=SESSION_LENGTH, seed=0, items=None):
+    """
+    Runs 'sessions' simulated sessions spread over 'workers' processes.
+    Returns the summed counters (a dict keyed by STAT_FIELDS).
+    """
+    catalog = SharedCatalog.create(items)
+    counters = SharedCounters.create(STAT_FIELDS, workers)
+    try:
+        tasks = [(catalog.name, counters.name, workers, row, worker_sessions, session_length, seed + row)
+                 for row, worker_sessions in enumerate(split_evenly(sessions, workers))]
+        with multiprocessing.Pool(workers) as pool:
+            pool.starmap(simulate_chunk, tasks)
+        return counters.totals()
+    finally:
+        counters.close()
+        catalog.close()
+
+
+def format_summary(totals):
+    """Turns run_simulation() totals into a short human-readable report."""
+    lines = [
+        f"Sessions: {totals['sessions']}, customers: {totals['customers']}",
+        f"Served: {totals['served']}, stockouts: {totals['stockouts']}, "
+        f"verification failures: {totals['verification_failures']}",
+        f"Revenue: ₱{totals['revenue']}, restock spend: ₱{totals['restock_spend']}",
+        "Revenue per session (p10/p50/p90 <=): " + " / ".join(
+            f"₱{histogram_percentile(totals, 'session_revenue', REVENUE_BUCKETS, fraction)}"
+            for fraction in (0.1, 0.5, 0.9)),
+    ]
+    for level in sorted(LEVEL_UP_COSTS):
+        reached = totals[f"reached_level_{level}"]
+        average = totals[f"ticks_to_level_{level}"] / reached if reached else float("nan")
+        median = histogram_percentile(totals, f"level_{level}_ticks", TICKS_BUCKETS, 0.5)
+        lines.append(f"Level {level}: reached in {reached}/{totals['sessions']} sessions, "
+                     f"after {average:.1f} customers on average (median <= {median})")
+    return "\n".join(lines)
+
+
+def scaling_report(max_workers, sessions, session_length=SESSION_LENGTH, seed=0):
+    """Runs the same workload with 1..max_workers processes and prints throughput and speedup."""
+    print(f"{'workers':>7} {'seconds':>8} {'customers/s':>12} {'speedup':>8}")
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        started = time.perf_counter()
+        totals = run_simulation(sessions, workers, session_length, seed)
+        elapsed = time.perf_counter() - started
+        baseline = baseline or elapsed
+        print(f"{workers:>7} {elapsed:>8.2f} {totals['customers'] / elapsed:>12.0f} {baseline / elapsed:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless Script & Serve shop simulations.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+    parser.add_argument("--sessions", type=int, default=1000, help="Number of simulated player sessions.")
+    parser.add_argument("--session-length", type=int, default=SESSION_LENGTH, help="Customers per session.")
+    parser.add_argument("--seed", type=int, default=0, help="Base random seed (worker i uses seed + i).")
+    parser.add_argument("--scaling", action="store_true", help="Report throughput for 1..--workers processes.")
+    args = parser.parse_args()
+
+    if args.scaling:
+        scaling_report(args.workers, args.sessions, args.session_length, args.seed)
+    else:
+        started = time.perf_counter()
+        totals = run_simulation(args.sessions, args.workers, args.session_length, args.seed)
+        print(format_summary(totals))
+        print(f"Finished in {time.perf_counter() - started:.2f}s using {args.workers} worker(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import ast
+import sys
+from collections import namedtuple
+
+from game_state import ALL_GAME_ITEMS, copy_customer
+
+PLAYER_CODE_FILENAME = "<player code>"
+# Names grade_submission puts in the player code's globals (also offered by the code box autocomplete)
+PLAYER_GLOBAL_NAMES = ("inventory", "balance", "current_selected_customer_data", "print")
+LIVE_CHECK_STEP_BUDGET = 1000000  # Max bytecode steps of player code a live check may run (guards against endless loops)
+LIVE_CHECK_TIME_LIMIT_SECONDS = 2  # The checker's worker process is killed after this (loops that outlive the budget)
+BULK_FUNCTION_NAME = "fulfill"  # Serve All calls fulfill(order, inventory, balance) -> new balance
+BULK_STEP_BUDGET_PER_ORDER = 100000  # Max bytecode steps of player code per customer in a Serve All batch
+BULK_TIME_LIMIT_SECONDS = 2  # Serve All's worker process is killed after this (plus the per-order allowance below)
+BULK_TIME_LIMIT_SECONDS_PER_ORDER = 0.05  # A fulfill() call that uses its whole step budget takes about 0.02 s
+BULK_REPORTED_PROBLEMS = 5  # Skipped/failed customers listed by name in the Serve All summary
+
+# Outcome of grading one submission. 'verdict' is one of: correct, logic_error, syntax_error,
+# key_error, type_error, runtime_error (plus syntax_ok and bulk_ok from live_check, see there).
+# updated_inventory/updated_balance are only set when correct.
+SubmissionResult = namedtuple("SubmissionResult", "verdict title message updated_inventory updated_balance",
+                              defaults=(None, None))
+
+# Outcome of one Serve All batch. 'served' lists the ids of the customers served (in order);
+# 'skipped' and 'failed' list (customer, reason) pairs. verdict is correct (nobody failed),
+# logic_error (some orders failed), syntax_error, missing_function or runtime_error (the code
+# could not even define the function; nothing is served then).
+BulkResult = namedtuple("BulkResult", "verdict title message served skipped failed updated_inventory updated_balance",
+                        defaults=(None, None))
+
+
+def verify_transaction(original_inventory, updated_inventory, original_balance, updated_balance, order,
+                       catalog=ALL_GAME_ITEMS):
+    """
+    Checks that going from (original_inventory, original_balance) to
+    (updated_inventory, updated_balance) is exactly the sale of 'order'.
+
+    Returns None if the transaction is correct, otherwise the error message to show the player.
+    Does not modify any of its arguments.
+    """
+    total_expected_gain = 0
+
+    # 1. Check if all ordered items were attempted to be deducted
+    for item, qty_ordered in order.items():
+        # Check if item exists in game's master list (for price lookup)
+        if item not in catalog:
+            return f"Logic Error: Customer ordered '{item}' which is not a recognized item in your shop's master list."
+
+        # Check if player's code somehow removed the item from inventory dict, or bad key
+        if item not in updated_inventory or 'stock' not in updated_inventory[item]:
+            return f"Logic Error: Your code removed '{item}' from inventory or corrupted its structure."
+
+        # Check if original stock was sufficient for this order
+        original_stock_for_item = original_inventory.get(item, {}).get('stock', 0)
+        if original_stock_for_item < qty_ordered:
+            return (f"Logical Error: You tried to fulfill '{item}' ({qty_ordered}) but only had "
+                    f"{original_stock_for_item} in stock originally. Cannot sell what you don't have!")
+
+        # Check if stock was correctly deducted
+        expected_stock_after_deduction = original_stock_for_item - qty_ordered
+        if updated_inventory[item]['stock'] != expected_stock_after_deduction:
+            return (f"Logic Error: Stock for '{item}' is incorrect.\nExpected: {expected_stock_after_deduction}, "
+                    f"Actual: {updated_inventory[item]['stock']}\n(Did you use `-=` and the correct quantity?)")
+
+        # Calculate expected gain
+        total_expected_gain += catalog[item]['price'] * qty_ordered
+
+    # 2. Check if final balance is correct (only if item deductions passed)
+    expected_balance_after_sale = original_balance + total_expected_gain
+    if updated_balance != expected_balance_after_sale:
+        return (f"Logic Error: Balance is incorrect.\nExpected: ₱{expected_balance_after_sale}, "
+                f"Actual: ₱{updated_balance}\n(Did you correctly calculate total earnings and use "
+                f"`balance[0] += amount`?)")
+
+    # 3. Check for unexpected deductions (player deducted items not in order, or extra items)
+    for item_name_in_inv, original_details in original_inventory.items():
+        original_stock = original_details['stock']
+        current_stock_after_player_code = updated_inventory.get(item_name_in_inv, {}).get('stock', original_stock)
+
+        # If item was not in order but stock changed OR stock changed more than ordered
+        if (item_name_in_inv not in order and current_stock_after_player_code != original_stock) or \
+                (item_name_in_inv in order and current_stock_after_player_code < (
+                        original_stock - order[item_name_in_inv])):
+            return (f"Logic Error: You deducted '{item_name_in_inv}' which was NOT in the customer's order, "
+                    f"or you deducted too many items.")
+
+    return None
+
+
+def grade_submission(player_code, inventory, balance, customer_data, catalog=ALL_GAME_ITEMS, print_function=print):
+    """
+    Runs the player's code (source string or compiled code object) against copies of
+    'inventory' and 'balance' and verifies the resulting transaction for 'customer_data'.
+    The real game state is never modified; returns a SubmissionResult.
+    """
+    # Create copies of inventory and balance for the player's code to modify.
+    # This allows us to verify changes without directly affecting the real game state yet.
+    exec_inventory = {item: data.copy() for item, data in inventory.items()}
+
+    # A mutable list to hold balance so inner code can modify it and it's reflected outside
+    # (because integers are immutable, `balance += X` creates a new int, not modifies the original if global)
+    balance_wrapper = [balance]
+
+    # Define the scope for the player's code execution
+    execution_globals = {
+        'inventory': exec_inventory,  # Player can access/modify this
+        'balance': balance_wrapper,  # Player can access/modify this (via [0])
+        # Player can access customer data (a copy, so the order verified below is the one the customer placed)
+        'current_selected_customer_data': copy_customer(customer_data),
+        'print': print_function,  # Allow player to use print() for debugging
+        # You can add other helper functions here for higher levels
+    }
+    execution_locals = {}  # No specific local variables needed
+
+    try:
+        # Execute the player's code
+        exec(player_code, execution_globals, execution_locals)
+
+        # After execution, retrieve updated values from the execution environment
+        updated_inventory = execution_globals['inventory']
+        updated_balance = execution_globals['balance'][0]  # Get the value from the list wrapper
+
+        verification_error = verify_transaction(inventory, updated_inventory, balance, updated_balance,
+                                                customer_data['order'], catalog)
+        if verification_error is not None:
+            return SubmissionResult("logic_error", "Code Error", verification_error)
+        return SubmissionResult("correct", "Code Correct!",
+                                "Your Python code executed successfully and the transaction logic is correct!"
+                                "\n\nNow, click 'Complete Sale' to finalize.",
+                                updated_inventory, updated_balance)
+
+    except SyntaxError as e:
+        return SubmissionResult("syntax_error", "Syntax Error",
+                                f"Your Python code has a SYNTAX ERROR:\n\n{e}\n\nPlease fix your code "
+                                f"(check typos, missing colons, indentation).")
+    except KeyError as e:
+        return SubmissionResult("key_error", "Key Error",
+                                f"Your Python code has a KEY ERROR:\n\nYou tried to access an item or dictionary key "
+                                f"that doesn't exist or is misspelled: {e}\n\nRemember to use exact item names like "
+                                f"'health potion' and correct dictionary keys like 'stock' or 'price'.")
+    except TypeError as e:
+        return SubmissionResult("type_error", "Type Error",
+                                f"Your Python code has a TYPE ERROR:\n\n{e}\n\nCheck if you're performing operations "
+                                f"on the wrong type of data (e.g., adding a string to a number, or using `balance` "
+                                f"without `[0]` if it's a list).")
+    except Exception as e:
+        # Catch any other unexpected errors
+        return SubmissionResult("runtime_error", "Runtime Error",
+                                f"An unexpected PYTHON RUNTIME ERROR occurred:\n\n{e}\n\nReview your code carefully.")
+
+
+def _run_with_step_budget(step_budget, function, *args, **kwargs):
+    """
+    Calls function(*args, **kwargs) while counting the bytecode steps executed by player
+    code in this thread; raises RuntimeError inside the player code once 'step_budget' is used up.
+    (Steps rather than lines, because a one-line `while True: pass` never starts a new line.)
+
+    This only gives the player a quick, readable error. Code that catches the RuntimeError
+    (e.g. a bare 'except:' inside a loop) escapes the budget, because CPython removes a trace
+    function that raises; run untrusted code through code_runner.CodeRunner with a time limit.
+    """
+    steps_left = [step_budget]
+
+    def trace_steps(frame, event, arg):
+        if event == 'opcode':
+            steps_left[0] -= 1
+            if steps_left[0] < 0:
+                raise RuntimeError(f"Your code ran more than {step_budget} steps. Is there an endless loop?")
+        return trace_steps
+
+    def trace_calls(frame, event, arg):
+        # Only player code is traced, so the verification itself runs at full speed
+        if frame.f_code.co_filename != PLAYER_CODE_FILENAME:
+            return None
+        frame.f_trace_opcodes = True
+        return trace_steps
+
+    sys.settrace(trace_calls)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        sys.settrace(None)
+
+
+def live_check(player_code, inventory, balance, customer_data, previous_fingerprint=None,
+               step_budget=LIVE_CHECK_STEP_BUDGET):
+    """
+    Incremental check used while the player is typing (safe to call from a background thread).
+
+    Parses the code and returns (fingerprint, result). The fingerprint identifies the code's
+    AST together with the state it is checked against; if it equals 'previous_fingerprint'
+    (only whitespace/comments changed), the full run + verification is skipped and result is None.
+    Syntax errors return (None, result) so the next valid version is always re-checked.
+
+    Code that defines fulfill() is meant for Serve All: it is dry-run on the selected customer
+    with grade_bulk_submission, and a working function is reported as 'bulk_ok'.
+    """
+    try:
+        tree = ast.parse(player_code, PLAYER_CODE_FILENAME)
+    except SyntaxError as e:
+        return None, SubmissionResult("syntax_error", "Syntax Error",
+                                      f"Your Python code has a SYNTAX ERROR:\n\nLine {e.lineno}: {e.msg}")
+
+    customer_id = customer_data['id'] if customer_data else None
+    stock_levels = tuple((item, data.get('stock')) for item, data in inventory.items())
+    fingerprint = (ast.dump(tree), customer_id, balance, stock_levels)
+    if fingerprint == previous_fingerprint:
+        return fingerprint, None
+
+    defines_fulfill = any(isinstance(node, ast.FunctionDef) and node.name == BULK_FUNCTION_NAME
+                          for node in tree.body)
+    if customer_data is None:
+        if defines_fulfill:
+            return fingerprint, SubmissionResult("syntax_ok", "Syntax OK",
+                                                 f"Syntax OK. Select a customer to test {BULK_FUNCTION_NAME}() on "
+                                                 f"their order, or click 'Serve All'.")
+        return fingerprint, SubmissionResult("syntax_ok", "Syntax OK",
+                                             "Syntax OK. Select a customer to check the transaction.")
+    if defines_fulfill:
+        return fingerprint, _live_check_bulk(player_code, inventory, balance, customer_data)
+
+    code = compile(tree, PLAYER_CODE_FILENAME, "exec")
+    result = _run_with_step_budget(step_budget, grade_submission, code, inventory, balance, customer_data,
+                                   print_function=lambda *args, **kwargs: None)  # Don't echo prints on every keystroke
+    return fingerprint, result
+
+
+def _live_check_bulk(player_code, inventory, balance, customer_data):
+    """Dry-runs a Serve All submission on the selected customer only; returns a SubmissionResult."""
+    result = grade_bulk_submission(player_code, inventory, balance, [customer_data],
+                                   print_function=lambda *args, **kwargs: None)
+    if result.served:
+        return SubmissionResult("bulk_ok", "Serve All Ready",
+                                f"{BULK_FUNCTION_NAME}() handles this order correctly. Click 'Serve All' to serve "
+                                f"every waiting customer.")
+    if result.skipped:
+        return SubmissionResult("bulk_ok", "Serve All Ready",
+                                "Syntax OK. Not enough stock for this order, so Serve All would skip it.")
+    if result.failed:
+        return SubmissionResult("logic_error", "Code Error",
+                                f"{BULK_FUNCTION_NAME}() failed on this order:\n\n{_one_line(result.failed[0][1])}")
+    return SubmissionResult(result.verdict, result.title, result.message)
+
+
+def _one_line(reason):
+    """Joins a verification message into one line, dropping the '(Did you ...?)' hints meant for single orders."""
+    return " ".join(line for line in reason.split("\n") if not line.startswith("("))
+
+
+def _short_error(e):
+    """One-line description of an exception raised by player code."""
+    if isinstance(e, KeyError):
+        return f"KeyError: {e} does not exist (check item names and keys like 'stock' or 'price')."
+    return f"{type(e).__name__}: {e}"
+
+
+def _serve_in_sequence(fulfill, inventory, balance, customers, catalog):
+    """Runs fulfill() for every customer against the evolving state; returns (inventory, balance, served, skipped, failed)."""
+    served, skipped, failed = [], [], []
+    for customer in customers:
+        order = customer['order']
+        short = [item for item, qty in order.items() if inventory.get(item, {}).get('stock', 0) < qty]
+        if short:
+            skipped.append((customer, "not enough " + ", ".join(short)))
+            continue
+
+        exec_inventory = {item: data.copy() for item, data in inventory.items()}
+        try:
+            # Budget per call: a trace function that raises is removed, so it is installed again for every customer
+            updated_balance = _run_with_step_budget(BULK_STEP_BUDGET_PER_ORDER, fulfill, dict(order), exec_inventory,
+                                                    balance)
+        except Exception as e:
+            failed.append((customer, _short_error(e)))
+            continue
+        if isinstance(updated_balance, bool) or not isinstance(updated_balance, (int, float)):
+            failed.append((customer, f"{BULK_FUNCTION_NAME}() must return the new balance (a number), "
+                                     f"not {updated_balance!r}."))
+            continue
+
+        verification_error = verify_transaction(inventory, exec_inventory, balance, updated_balance, order, catalog)
+        if verification_error is not None:
+            failed.append((customer, verification_error))
+            continue
+        inventory, balance = exec_inventory, updated_balance
+        served.append(customer['id'])
+    return inventory, balance, served, skipped, failed
+
+
+def _bulk_summary(customers, served, skipped, failed, original_balance, updated_balance):
+    lines = [f"Served {len(served)} of {len(customers)} customers, earning ₱{updated_balance - original_balance}."]
+    for heading, problems in (("Skipped (not enough stock)", skipped), ("Failed", failed)):
+        if not problems:
+            continue
+        lines.append(f"\n{heading}: {len(problems)}")
+        for customer, reason in problems[:BULK_REPORTED_PROBLEMS]:
+            lines.append(f"  - {customer['name']}: {_one_line(reason)}")
+        if len(problems) > BULK_REPORTED_PROBLEMS:
+            lines.append(f"  ... and {len(problems) - BULK_REPORTED_PROBLEMS} more")
+    return "\n".join(lines)
+
+
+def grade_bulk_submission(player_code, inventory, balance, customers, catalog=ALL_GAME_ITEMS, print_function=print):
+    """
+    Serve All: runs the player's code once to define fulfill(order, inventory, balance), then calls
+    it for every customer in 'customers' (in that order). Each call gets a copy of the stock left
+    after the previous sales and must return the new balance; the result is checked with
+    verify_transaction before the next customer. Customers whose order cannot be filled from the
+    remaining stock are skipped, and failed calls leave the state unchanged. The real game state
+    is never modified; returns a BulkResult with one summary for the whole batch.
+    """
+    execution_globals = {'print': print_function}
+    try:
+        code = compile(player_code, PLAYER_CODE_FILENAME, "exec")
+        # Top-level code (e.g. a slow loop before 'def fulfill') gets the same step budget as each call
+        _run_with_step_budget(BULK_STEP_BUDGET_PER_ORDER, exec, code, execution_globals)
+    except SyntaxError as e:
+        return BulkResult("syntax_error", "Syntax Error",
+                          f"Your Python code has a SYNTAX ERROR:\n\n{e}\n\nPlease fix your code "
+                          f"(check typos, missing colons, indentation).", [], [], [])
+    except Exception as e:
+        return BulkResult("runtime_error", "Runtime Error",
+                          f"An unexpected PYTHON RUNTIME ERROR occurred while defining your function:\n\n{e}",
+                          [], [], [])
+
+    fulfill = execution_globals.get(BULK_FUNCTION_NAME)
+    if not callable(fulfill):
+        return BulkResult("missing_function", "Function Missing",
+                          f"Serve All needs a function:\n\n    def {BULK_FUNCTION_NAME}(order, inventory, balance):\n"
+                          f"        ...\n        return balance\n\nIt is called once per customer with their order "
+                          f"and must update inventory and return the new balance.", [], [], [])
+
+    customers = list(customers)
+    updated_inventory, updated_balance, served, skipped, failed = _serve_in_sequence(fulfill, inventory, balance,
+                                                                                     customers, catalog)
+    message = _bulk_summary(customers, served, skipped, failed, balance, updated_balance)
+    if failed:
+        return BulkResult("logic_error", "Serve All: Some Orders Failed", message, served, skipped, failed,
+                          updated_inventory, updated_balance)
+    return BulkResult("correct", "Serve All Complete", message, served, skipped, failed,
+                      updated_inventory, updated_balance)
@@ -0,0 +1,291 @@
+import atexit
+import builtins
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+# --- LOG / METRICS FILE LOCATIONS ---
+LOG_DIR = "logs"
+EVENT_LOG_PATH = os.path.join(LOG_DIR, "events.jsonl")  # One JSON object per line
+METRICS_PATH = os.path.join(LOG_DIR, "metrics.prom")  # Prometheus text exposition format
+
+EVENT_BUFFER_SIZE = 10000  # Max events waiting for the writer thread before the oldest are dropped
+FLUSH_INTERVAL_SECONDS = 1.0  # How often the writer thread wakes up on its own
+
+# Histogram buckets (seconds) for code grading latency
+GRADING_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class MetricsRegistry:
+    """
+    Holds counters, gauges and histograms in memory and renders them in the
+    Prometheus text format. Updates only take a lock and bump a number, so they
+    are cheap enough to call from the Run Code path.
+    """
+
+    def __init__(self, prefix="scriptserve"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._help = {}  # metric name -> (type, help text)
+        self._values = {}  # (metric name, labels tuple) -> value
+        self._histograms = {}  # (metric name, labels tuple) -> [bucket counts..., sum, count]
+        self._buckets = {}  # histogram name -> bucket upper bounds
+
+    def describe(self, name, metric_type, help_text, buckets=None, labelled=False):
+        """Registers a metric so it is always exported (unlabelled ones even while still zero)."""
+        full_name = f"{self.prefix}_{name}"
+        self._help[full_name] = (metric_type, help_text)
+        if metric_type == "histogram":
+            self._buckets[full_name] = tuple(buckets or GRADING_LATENCY_BUCKETS)
+        elif not labelled and (full_name, ()) not in self._values:
+            self._values[(full_name, ())] = 0
+
+    def inc(self, name, amount=1, **labels):
+        """Adds 'amount' to a counter."""
+        key = (f"{self.prefix}_{name}", tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """Sets a gauge to 'value'."""
+        key = (f"{self.prefix}_{name}", tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        """Records one observation in a histogram."""
+        full_name = f"{self.prefix}_{name}"
+        key = (full_name, tuple(sorted(labels.items())))
+        buckets = self._buckets.get(full_name, GRADING_LATENCY_BUCKETS)
+        with self._lock:
+            counts = self._histograms.get(key)
+            if counts is None:
+                counts = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, upper_bound in enumerate(buckets):
+                if value <= upper_bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self):
+        """Returns all metrics as Prometheus text format."""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: list(counts) for key, counts in self._histograms.items()}
+
+        lines = []
+        names = sorted({name for name, _ in values} | {name for name, _ in histograms} | set(self._help))
+        for name in names:
+            if name in self._help:
+                metric_type, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+            for (value_name, labels), value in sorted(values.items()):
+                if value_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (hist_name, labels), counts in sorted(histograms.items()):
+                if hist_name != name:
+                    continue
+                buckets = self._buckets.get(name, GRADING_LATENCY_BUCKETS)
+                for upper_bound, count in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', upper_bound),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {counts[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {counts[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {counts[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_PATH):
+        """Atomically replaces the metrics file with the current values."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _format_labels(labels):
+    """Formats a labels tuple as {key="value",...} (or nothing if there are no labels)."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class EventLogger:
+    """
+    Structured (JSON lines) event logger.
+
+    log() only appends the event to a bounded ring buffer, so callers never wait
+    on disk or stdout. A background thread drains the buffer to the event log file
+    every flush interval (or early, once the buffer is half full) and refreshes the
+    metrics file. If the buffer
+    fills up faster than it can be written, the oldest events are dropped (and counted).
+    """
+
+    def __init__(self, path=EVENT_LOG_PATH, metrics=None, metrics_path=METRICS_PATH,
+                 buffer_size=EVENT_BUFFER_SIZE, flush_interval=FLUSH_INTERVAL_SECONDS):
+        self.path = path
+        self.metrics = metrics
+        self.metrics_path = metrics_path
+        self.flush_interval = flush_interval
+        self.dropped_events = 0
+        self._buffer = collections.deque(maxlen=buffer_size)  # Ring buffer: full deque discards the oldest entry
+        self._high_water_mark = max(1, buffer_size // 2)
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._writer_thread = None
+        self._start_lock = threading.Lock()
+
+    def log(self, event, **fields):
+        """Queues one event (a name plus any JSON-serialisable fields) for writing."""
+        if self._writer_thread is None:
+            self._start_writer()
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped_events += 1
+        fields["ts"] = time.time()
+        fields["event"] = event
+        self._buffer.append(fields)
+        if len(self._buffer) >= self._high_water_mark:  # Otherwise the writer picks it up on its next interval
+            self._wakeup.set()
+
+    def _start_writer(self):
+        """Starts the background writer thread the first time something is logged."""
+        with self._start_lock:
+            if self._writer_thread is not None:
+                return
+            self._writer_thread = threading.Thread(target=self._writer_loop, name="event-log-writer", daemon=True)
+            self._writer_thread.start()
+            atexit.register(self.close)
+
+    def _writer_loop(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self._drain(f)
+                if self.metrics is not None:
+                    try:
+                        self.metrics.write(self.metrics_path)
+                    except OSError as e:
+                        print(f"Warning: could not write metrics file '{self.metrics_path}': {e}")
+                if self._stopping:
+                    break
+
+    def _drain(self, f):
+        """Writes every buffered event to the open log file."""
+        lines = []
+        while True:
+            try:
+                event = self._buffer.popleft()
+            except IndexError:
+                break
+            lines.append(json.dumps(event, default=str))
+        if self.dropped_events:
+            lines.append(json.dumps({"ts": time.time(), "event": "events_dropped", "count": self.dropped_events}))
+            self.dropped_events = 0
+        if lines:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+
+    def recent(self):
+        """Returns the events still waiting in the ring buffer (oldest first)."""
+        return list(self._buffer)
+
+    def close(self):
+        """Flushes everything that is still buffered and stops the writer thread."""
+        if self._writer_thread is None or self._stopping:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._writer_thread.join(timeout=5)
+
+
+class StartupProfiler:
+    """
+    Records how long each import and construction phase takes while the game starts
+    (enabled with main.py --profile-startup). Disabled, phase() costs almost nothing.
+    """
+
+    MIN_REPORTED_SECONDS = 0.0005  # Imports faster than this are left out of the report
+
+    def __init__(self):
+        self.started = time.perf_counter()  # Roughly when main.py started importing
+        self.enabled = False
+        self.entries = []  # (label, start offset in seconds, duration in seconds or None for marks)
+        self._original_import = None
+
+    def enable(self):
+        """Starts profiling, including every top-level import from now on."""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._original_import = builtins.__import__
+        original_import = self._original_import
+        depth = [0]  # Nested imports are counted inside the import that triggered them
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if depth[0] or threading.current_thread() is not threading.main_thread():
+                return original_import(name, globals, locals, fromlist, level)
+            depth[0] += 1
+            began = time.perf_counter()
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                depth[0] -= 1
+                elapsed = time.perf_counter() - began
+                if elapsed >= self.MIN_REPORTED_SECONDS:
+                    label = f"from {name} import {', '.join(fromlist)}" if fromlist else f"import {name}"
+                    self.entries.append((label, began - self.started, elapsed))
+
+        builtins.__import__ = timed_import
+
+    @contextlib.contextmanager
+    def phase(self, label):
+        """Context manager timing one construction phase."""
+        if not self.enabled:
+            yield
+            return
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.entries.append((label, began - self.started, time.perf_counter() - began))
+
+    def mark(self, label):
+        """Records a point in time (e.g. 'window shown')."""
+        if self.enabled:
+            self.entries.append((label, time.perf_counter() - self.started, None))
+
+    def report(self):
+        """Stops timing imports and returns the startup breakdown as text."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+        lines = ["Startup profile (seconds since main.py started):",
+                 f"  {'at':>7}  {'took':>7}  step"]
+        for label, offset, duration in sorted(self.entries, key=lambda entry: entry[1]):
+            took = "" if duration is None else f"{duration:7.3f}"
+            lines.append(f"  {offset:7.3f}  {took:>7}  {label}")
+        return "\n".join(lines)
+
+
+# --- SHARED GAME-WIDE INSTANCES ---
+metrics = MetricsRegistry()
+metrics.describe("submissions_total", "counter", "Player code submissions run through the grader.")
+metrics.describe("verdicts_total", "counter", "Grading verdicts by type.", labelled=True)
+metrics.describe("grading_latency_seconds", "histogram", "Time spent executing and verifying player code.")
+metrics.describe("queue_length", "gauge", "Customers currently waiting in the shop.")
+metrics.describe("revenue_total", "counter", "Money earned from verified sales.")
+metrics.describe("customers_generated_total", "counter", "Customers generated.")
+metrics.describe("sales_completed_total", "counter", "Sales finalised with 'Complete Sale'.")
+
+event_log = EventLogger(metrics=metrics)
+
+startup_profiler = StartupProfiler()